@@ -5,7 +5,12 @@ Web UI for browsing and managing database tables.
 Access at: http://localhost:8000/admin
 """
 
+import logging
 from sqladmin import Admin, ModelView
+from sqlalchemy import text
+from sqlalchemy.orm import raiseload
+from starlette.requests import Request
+from app.config import settings
 from app.models.user import User
 from app.models.deal import Deal, DealRequirement, DealAnalysis
 from app.models.employee import Employee
@@ -13,108 +18,162 @@ from app.models.document import Document, DocumentChunk
 from app.models.alert import Alert, RecoveryAction
 from app.models.proposal import Proposal
 
+logger = logging.getLogger(__name__)
+
+# Admin list pages share the API's engine; below this they start queueing behind API traffic
+MIN_ADMIN_POOL_SIZE = 20
+
+
+# ── Base Views ───────────────────────────────────────────
+
+class BaseAdmin(ModelView):
+    """Shared list settings — page size is capped so a page never pulls more than 100 rows."""
+    page_size = 25
+    page_size_options = [25, 50, 100]
+
+    def list_query(self, request: Request):
+        # List pages only show scalar columns; any relationship SQLAdmin needs for a
+        # listed column is selectinloaded explicitly, so anything else lazy-loading
+        # per row is an N+1 regression and should fail loudly.
+        return super().list_query(request).options(raiseload("*"))
+
+
+class EstimatedCountAdmin(BaseAdmin):
+    """For unbounded tables: use the planner's row estimate instead of COUNT(*) on Postgres.
+
+    Exact counts are still used for searches (the estimate covers the whole table)
+    and on SQLite, or when there is no positive estimate (a never-analyzed table reports
+    -1, or 0 before PostgreSQL 14, even when it has rows).
+    """
+
+    async def count(self, request: Request, stmt=None) -> int:
+        if not settings.DATABASE_URL.startswith("sqlite") and not request.query_params.get("search"):
+            estimate_stmt = text(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = :table"
+            ).bindparams(table=self.model.__tablename__)
+            rows = await self._run_query(estimate_stmt)
+            if rows and rows[0] > 0:
+                return rows[0]
+        return await super().count(request, stmt)
+
 
 # ── Model Views ──────────────────────────────────────────
 
-class UserAdmin(ModelView, model=User):
-    column_list = [User.id, User.email, User.full_name, User.role, User.created_at]
-    column_searchable_list = [User.email, User.full_name]
-    column_sortable_list = [User.id, User.email, User.created_at]
+class UserAdmin(BaseAdmin, model=User):
+    column_list = ["id", "email", "full_name", "role", "created_at"]
+    column_searchable_list = ["email", "full_name"]
+    column_sortable_list = ["id", "email", "created_at"]
     name = "User"
     name_plural = "Users"
     icon = "fa-solid fa-user"
 
 
-class DealAdmin(ModelView, model=Deal):
-    column_list = [Deal.id, Deal.title, Deal.client_name, Deal.deal_value, Deal.stage, Deal.health_score, Deal.status, Deal.created_at]
-    column_searchable_list = [Deal.title, Deal.client_name]
-    column_sortable_list = [Deal.id, Deal.title, Deal.deal_value, Deal.health_score, Deal.created_at]
+class DealAdmin(EstimatedCountAdmin, model=Deal):
+    column_list = ["id", "title", "client_name", "deal_value", "stage", "health_score", "status", "created_at"]
+    column_searchable_list = ["title", "client_name"]
+    column_sortable_list = ["id", "title", "deal_value", "health_score", "created_at"]
     name = "Deal"
     name_plural = "Deals"
     icon = "fa-solid fa-handshake"
 
 
-class DealRequirementAdmin(ModelView, model=DealRequirement):
-    column_list = [DealRequirement.id, DealRequirement.deal_id, DealRequirement.category, DealRequirement.confidence, DealRequirement.is_met]
-    column_sortable_list = [DealRequirement.id, DealRequirement.confidence]
+class DealRequirementAdmin(BaseAdmin, model=DealRequirement):
+    column_list = ["id", "deal_id", "category", "confidence", "is_met"]
+    column_sortable_list = ["id", "confidence"]
     name = "Deal Requirement"
     name_plural = "Deal Requirements"
     icon = "fa-solid fa-list-check"
 
 
-class DealAnalysisAdmin(ModelView, model=DealAnalysis):
-    column_list = [DealAnalysis.id, DealAnalysis.deal_id, DealAnalysis.analysis_type, DealAnalysis.confidence_score, DealAnalysis.created_at]
-    column_sortable_list = [DealAnalysis.id, DealAnalysis.confidence_score, DealAnalysis.created_at]
+class DealAnalysisAdmin(BaseAdmin, model=DealAnalysis):
+    column_list = ["id", "deal_id", "analysis_type", "confidence_score", "created_at"]
+    column_sortable_list = ["id", "confidence_score", "created_at"]
     name = "Deal Analysis"
     name_plural = "Deal Analyses"
     icon = "fa-solid fa-chart-line"
 
 
-class EmployeeAdmin(ModelView, model=Employee):
-    column_list = [Employee.id, Employee.name, Employee.role, Employee.department, Employee.availability_percent]
-    column_searchable_list = [Employee.name, Employee.role, Employee.department]
-    column_sortable_list = [Employee.id, Employee.name, Employee.department]
+class EmployeeAdmin(BaseAdmin, model=Employee):
+    column_list = ["id", "name", "role", "department", "availability_percent"]
+    column_searchable_list = ["name", "role", "department"]
+    column_sortable_list = ["id", "name", "department"]
     name = "Employee"
     name_plural = "Employees"
     icon = "fa-solid fa-users"
 
 
-class DocumentAdmin(ModelView, model=Document):
-    column_list = [Document.id, Document.filename, Document.file_type, Document.deal_id, Document.is_processed, Document.created_at]
-    column_searchable_list = [Document.filename]
-    column_sortable_list = [Document.id, Document.filename, Document.created_at]
+class DocumentAdmin(BaseAdmin, model=Document):
+    column_list = ["id", "filename", "file_type", "deal_id", "is_processed", "created_at"]
+    column_searchable_list = ["filename"]
+    column_sortable_list = ["id", "filename", "created_at"]
     name = "Document"
     name_plural = "Documents"
     icon = "fa-solid fa-file"
 
 
-class DocumentChunkAdmin(ModelView, model=DocumentChunk):
-    column_list = [DocumentChunk.id, DocumentChunk.document_id, DocumentChunk.chunk_index, DocumentChunk.embedding_id]
-    column_sortable_list = [DocumentChunk.id, DocumentChunk.chunk_index]
+class DocumentChunkAdmin(EstimatedCountAdmin, model=DocumentChunk):
+    column_list = ["id", "document_id", "chunk_index", "embedding_id"]
+    column_sortable_list = ["id", "chunk_index"]
     name = "Document Chunk"
     name_plural = "Document Chunks"
     icon = "fa-solid fa-puzzle-piece"
 
 
-class AlertAdmin(ModelView, model=Alert):
-    column_list = [Alert.id, Alert.deal_id, Alert.alert_type, Alert.severity, Alert.title, Alert.is_resolved, Alert.created_at]
-    column_searchable_list = [Alert.title]
-    column_sortable_list = [Alert.id, Alert.severity, Alert.created_at]
+class AlertAdmin(EstimatedCountAdmin, model=Alert):
+    column_list = ["id", "deal_id", "alert_type", "severity", "title", "is_resolved", "created_at"]
+    column_searchable_list = ["title"]
+    column_sortable_list = ["id", "severity", "created_at"]
     name = "Alert"
     name_plural = "Alerts"
     icon = "fa-solid fa-bell"
 
 
-class RecoveryActionAdmin(ModelView, model=RecoveryAction):
-    column_list = [RecoveryAction.id, RecoveryAction.alert_id, RecoveryAction.action_text, RecoveryAction.priority, RecoveryAction.is_completed]
-    column_sortable_list = [RecoveryAction.id, RecoveryAction.priority]
+class RecoveryActionAdmin(BaseAdmin, model=RecoveryAction):
+    column_list = ["id", "alert_id", "action_text", "priority", "is_completed"]
+    column_sortable_list = ["id", "priority"]
     name = "Recovery Action"
     name_plural = "Recovery Actions"
     icon = "fa-solid fa-wrench"
 
 
-class ProposalAdmin(ModelView, model=Proposal):
-    column_list = [Proposal.id, Proposal.deal_id, Proposal.title, Proposal.status, Proposal.version, Proposal.created_at]
-    column_searchable_list = [Proposal.title]
-    column_sortable_list = [Proposal.id, Proposal.title, Proposal.created_at]
+class ProposalAdmin(BaseAdmin, model=Proposal):
+    column_list = ["id", "deal_id", "title", "status", "version", "created_at"]
+    column_searchable_list = ["title"]
+    column_sortable_list = ["id", "title", "created_at"]
     name = "Proposal"
     name_plural = "Proposals"
     icon = "fa-solid fa-file-contract"
 
 
+ADMIN_VIEWS = (
+    UserAdmin,
+    DealAdmin,
+    DealRequirementAdmin,
+    DealAnalysisAdmin,
+    EmployeeAdmin,
+    DocumentAdmin,
+    DocumentChunkAdmin,
+    AlertAdmin,
+    RecoveryActionAdmin,
+    ProposalAdmin,
+)
+
+
 def setup_admin(app, engine):
-    """Mount SQLAdmin on the FastAPI app."""
+    """Mount SQLAdmin on the FastAPI app.
+
+    The admin reuses the app's engine, so its pool is sized in app/database.py
+    (DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_RECYCLE).
+    """
+    pool_size = getattr(engine.pool, "size", None)
+    if engine.dialect.name != "sqlite" and callable(pool_size) and pool_size() < MIN_ADMIN_POOL_SIZE:
+        logger.warning(
+            "SQLAdmin: engine pool_size=%d is below %d — admin pages may queue behind API requests",
+            pool_size(), MIN_ADMIN_POOL_SIZE,
+        )
     admin = Admin(app, engine, title="DealMind Admin", base_url="/admin")
 
-    admin.add_view(UserAdmin)
-    admin.add_view(DealAdmin)
-    admin.add_view(DealRequirementAdmin)
-    admin.add_view(DealAnalysisAdmin)
-    admin.add_view(EmployeeAdmin)
-    admin.add_view(DocumentAdmin)
-    admin.add_view(DocumentChunkAdmin)
-    admin.add_view(AlertAdmin)
-    admin.add_view(RecoveryActionAdmin)
-    admin.add_view(ProposalAdmin)
+    for view in ADMIN_VIEWS:
+        admin.add_view(view)
 
     return admin
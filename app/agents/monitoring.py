@@ -1,39 +1,32 @@
-import json
+import functools
 import logging
-from typing import Dict, Any
-from langgraph.graph import StateGraph, END
+import re
+import orjson
+from itertools import chain, islice
+from typing import Dict, Any, List
+from langgraph.graph import StateGraph, START, END
 from app.agents.state import MonitoringState
-from app.services.llm import call_llm
+from app.services.llm import call_llm, strip_code_fence
 
 logger = logging.getLogger(__name__)
 
+# Phrases in raw emails that indicate the client is talking to other vendors
+COMPETITOR_TERMS = ("competitor", "another vendor", "other vendor", "alternative vendor")
+# Single alternation compiled once — one C-level pass per text instead of a lower()+`in` per term
+_COMPETITOR_RE = re.compile("|".join(map(re.escape, COMPETITOR_TERMS)), re.IGNORECASE)
 
-def sentiment_node(state: MonitoringState) -> Dict[str, Any]:
-    """Step 1: Analyze sentiment from recent communications."""
-    logger.info("sentiment node: starting communication sentiment analysis")
-    communications = state.get("recent_communications", [])
-    deal_data = state.get("deal_data", {})
+# '"Jane Doe" <jane@acme.com>' / 'Jane Doe <jane@acme.com>' → display name + address
+_FROM_RE = re.compile(r'^\s*"?(?P<name>[^"<]*?)"?\s*<(?P<addr>[^>]+)>\s*$')
 
-    if not communications:
-        logger.warning("sentiment node: no communications found to analyze")
-        return {
-            "sentiment_scores": [],
-            "overall_sentiment": 0.0,
-            "current_step": "sentiment",
-        }
+# Per-email content cap for the sentiment prompt — long reply chains are mostly quoted history
+MAX_EMAIL_CHARS = 1500
+# A reply email plus a handful of action items fits well under this; leaves headroom for R1 reasoning
+RECOVERY_MAX_TOKENS = 1024
 
-    # Build communications text — emails are sorted newest-first
-    comms_lines = []
-    for i, c in enumerate(communications[:10]):
-        label = "★ MOST RECENT EMAIL" if i == 0 else f"Email #{i + 1}"
-        from_field = c.get('from', 'unknown')
-        subject = c.get('subject', '(no subject)')
-        date = c.get('date', 'unknown')
-        content = c.get('content', '')
-        comms_lines.append(f"--- {label} (Date: {date}) ---\nFrom: {from_field}\nSubject: {subject}\n{content}")
-    comms_text = "\n\n".join(comms_lines)
 
-    prompt = f"""You are Quinn, an AI deal intelligence agent. Analyze the sentiment of these recent communications for the deal: {deal_data.get('title', 'Unknown Deal')}.
+# ── Prompt templates (str.format — doubled braces are literal JSON braces) ──
+
+SENTIMENT_PROMPT_TEMPLATE = """You are Quinn, an AI deal intelligence agent. Analyze the sentiment of these recent communications for the deal: {deal_title}.
 
 IMPORTANT: The emails below are sorted NEWEST FIRST. The ★ MOST RECENT EMAIL carries the HIGHEST weight — it reflects the client's CURRENT state of mind. Older emails provide context but should NOT override the latest sentiment. If the latest email is positive, the overall sentiment should lean positive even if older emails were negative (the situation has improved).
 
@@ -57,25 +50,120 @@ Analyze each communication and provide overall sentiment. The overall_sentiment
 
 Return ONLY valid JSON."""
 
-    result_text = call_llm(prompt, max_tokens=2048)
+POSITIVE_REPLY_PROMPT_TEMPLATE = """You are Quinn, an AI deal intelligence agent. The client has sent a POSITIVE email about the deal. Generate a warm, professional reply to strengthen the relationship.
 
-    try:
-        if "```json" in result_text:
-            result_text = result_text.split("```json")[1].split("```")[0]
-        elif "```" in result_text:
-            result_text = result_text.split("```")[1].split("```")[0]
+DEAL: {deal_title}
+CLIENT: {client_name}
+SENTIMENT: {sentiment:.2f} (POSITIVE)
+DEAL VALUE: {deal_value}
+
+SOURCE EMAILS:
+{comms_summary}
+
+RECIPIENT: {recipient} at {sender_email}
+
+Generate:
+1. A warm, professional reply email to {recipient} that:
+   - Thanks them for the positive feedback
+   - References specific points they mentioned in their email
+   - Reaffirms your commitment to the project
+   - Proposes next steps or expresses excitement about future collaboration
+   - Is well-formatted with separate paragraphs (use \\n\\n between paragraphs)
+   - Starts with a greeting and ends with a professional sign-off
+2. A list of internal action items to capitalize on the positive momentum
+
+Return JSON:
+{{
+    "recovery_email": "Subject: Re: ...\n\nDear {recipient},\n\nThank you paragraph...\n\nSpecific feedback reference...\n\nNext steps...\n\nBest regards,\\n[Name]\\n[Title]",
+    "recovery_actions": [
+        "Action item 1",
+        "Action item 2"
+    ]
+}}
+
+Return ONLY valid JSON."""
+
+RECOVERY_PROMPT_TEMPLATE = """You are Quinn, an AI deal intelligence agent. Based on these alerts for {client_label}, generate a recovery strategy.
+
+DEAL: {deal_title}
+CLIENT: {client_name}
+SENTIMENT: {sentiment:.2f}
+DEAL VALUE: {deal_value}
+
+ALERTS:
+{alert_summary}
+
+SOURCE EMAILS THAT TRIGGERED THESE ALERTS:
+{comms_summary}
+
+RECIPIENT FOR RECOVERY EMAIL: {recovery_to}
+
+Provide:
+1. A professional recovery email addressed to {recipient} at {sender_email}. The email should directly address their specific concerns from the source emails above, reaffirm value, and offer concrete next steps.
+   - The email MUST be well-formatted with separate paragraphs (use \\n\\n between paragraphs).
+   - Start with a greeting line (e.g. "Dear [Name],")
+   - Each key point should be its own paragraph
+   - End with a professional sign-off (e.g. "Best regards,\\n[Your Name]\\n[Your Title]")
+2. A list of internal action items for the team
+
+Return JSON:
+{{
+    "recovery_email": "Subject: Re: Concern about ...\n\nDear [Name],\n\nFirst paragraph addressing concern...\n\nSecond paragraph with value proposition...\n\nThird paragraph with next steps...\n\nBest regards,\n[Name]\n[Title]",
+    "recovery_actions": [
+        "Action item 1",
+        "Action item 2"
+    ]
+}}
+
+Return ONLY valid JSON."""
+
+
+def _format_communications(communications: List[Dict[str, Any]]) -> str:
+    """Render up to 10 emails (sorted newest-first) for a sentiment prompt."""
+    comms_lines = []
+    for i, c in enumerate(communications[:10]):
+        label = "★ MOST RECENT EMAIL" if i == 0 else f"Email #{i + 1}"
+        from_field = c.get('from', 'unknown')
+        subject = c.get('subject', '(no subject)')
+        date = c.get('date', 'unknown')
+        content = c.get('content', '')[:MAX_EMAIL_CHARS]
+        comms_lines.append(f"--- {label} (Date: {date}) ---\nFrom: {from_field}\nSubject: {subject}\n{content}")
+    return "\n\n".join(comms_lines)
+
+
+def sentiment_node(state: MonitoringState) -> Dict[str, Any]:
+    """Step 1: Analyze sentiment from recent communications."""
+    logger.info("sentiment node: starting communication sentiment analysis")
+    communications = state.get("recent_communications", [])
+    deal_data = state.get("deal_data", {})
+
+    if not communications:
+        logger.warning("sentiment node: no communications found to analyze")
+        return {
+            "sentiment_scores": [],
+            "overall_sentiment": 0.0,
+            "current_step": "sentiment",
+        }
+
+    prompt = SENTIMENT_PROMPT_TEMPLATE.format(
+        deal_title=deal_data.get('title', 'Unknown Deal'),
+        comms_text=_format_communications(communications),
+    )
+
+    result_text = call_llm(prompt, max_tokens=2048, cache=True)
 
-        result = json.loads(result_text.strip())
+    try:
+        result = orjson.loads(strip_code_fence(result_text).encode())
         sentiment_scores = result.get("scores", [])
         overall_sentiment = result.get("overall_sentiment", 0.0)
-        logger.info(f"sentiment node: sentiment analysis complete - communications_analyzed={len(sentiment_scores)}, overall_sentiment={overall_sentiment}")
+        logger.info("sentiment node: sentiment analysis complete - communications_analyzed=%d, overall_sentiment=%s", len(sentiment_scores), overall_sentiment)
         return {
             "sentiment_scores": sentiment_scores,
             "overall_sentiment": overall_sentiment,
             "current_step": "sentiment",
         }
-    except (json.JSONDecodeError, IndexError) as e:
-        logger.error(f"sentiment node: JSON parsing failed - {str(e)}")
+    except orjson.JSONDecodeError as e:
+        logger.error("sentiment node: JSON parsing failed - %s", e)
         return {
             "sentiment_scores": [],
             "overall_sentiment": 0.0,
@@ -83,6 +171,32 @@ Return ONLY valid JSON."""
         }
 
 
+def scan_node(state: MonitoringState) -> Dict[str, Any]:
+    """Keyword scan over raw communications — runs alongside the sentiment LLM call."""
+    communications = state.get("recent_communications", [])
+    hits = set()
+    for c in communications[:10]:
+        text = f"{c.get('subject', '')}\n{c.get('content', '')}"
+        hits.update(m.group(0).lower() for m in _COMPETITOR_RE.finditer(text))
+
+    logger.info("scan node: keyword scan complete - hits=%s", sorted(hits))
+    return {"keyword_hits": sorted(hits)}
+
+
+@functools.lru_cache(maxsize=4096)
+def _health_score(base_score: int, sentiment_adjustment: int) -> int:
+    return max(0, min(100, base_score + sentiment_adjustment))
+
+
+@functools.lru_cache(maxsize=4096)
+def _health_trend(health_score: int, previous_score: int) -> str:
+    if health_score > previous_score + 5:
+        return "up"
+    if health_score < previous_score - 5:
+        return "down"
+    return "stable"
+
+
 def health_node(state: MonitoringState) -> Dict[str, Any]:
     """Step 2: Calculate deal health score."""
     logger.info("health node: calculating deal health score")
@@ -93,20 +207,13 @@ def health_node(state: MonitoringState) -> Dict[str, Any]:
     base_score = deal_data.get("health_score", 70)
 
     # Sentiment adjustment (-20 to +10 points)
-    sentiment_adjustment = int(sentiment * 15)
-
-    health_score = max(0, min(100, base_score + sentiment_adjustment))
+    health_score = _health_score(base_score, int(sentiment * 15))
 
     # Determine trend
     previous_score = deal_data.get("previous_health_score", base_score)
-    if health_score > previous_score + 5:
-        trend = "up"
-    elif health_score < previous_score - 5:
-        trend = "down"
-    else:
-        trend = "stable"
+    trend = _health_trend(health_score, previous_score)
 
-    logger.info(f"health node: health score calculated - score={health_score}, trend={trend}")
+    logger.info("health node: health score calculated - score=%s, trend=%s", health_score, trend)
 
     return {
         "health_score": health_score,
@@ -121,6 +228,7 @@ def alert_node(state: MonitoringState) -> Dict[str, Any]:
     sentiment = state.get("overall_sentiment", 0.0)
     health_score = state.get("health_score", 70)
     sentiment_scores = state.get("sentiment_scores", [])
+    keyword_hits = state.get("keyword_hits", [])
     deal_data = state.get("deal_data", {})
 
     alerts = []
@@ -143,32 +251,36 @@ def alert_node(state: MonitoringState) -> Dict[str, Any]:
             "description": f"Deal health has dropped to {health_score}%. Review and take action.",
         })
 
-    # Check for competitor mentions in sentiment analysis
-    for score in sentiment_scores:
-        signals = score.get("signals", [])
-        for signal in signals:
-            if "competitor" in signal.lower():
-                alerts.append({
-                    "alert_type": "competitor_mention",
-                    "severity": "medium",
-                    "title": "Competitor mentioned in communications",
-                    "description": signal,
-                })
-                break
+    # Competitor mentions — a single alert from the first LLM signal naming one.
+    # The raw-email keyword scan can't tell "another vendor" from "no other vendor",
+    # so its hits only add context to a signal-based alert, never raise one
+    competitor_signal = next(
+        (signal for score in sentiment_scores for signal in score.get("signals", []) if _COMPETITOR_RE.search(signal)),
+        None,
+    )
+    if competitor_signal:
+        description = competitor_signal
+        if keyword_hits:
+            description += f" (recent emails mention: {', '.join(keyword_hits)})"
+        alerts.append({
+            "alert_type": "competitor_mention",
+            "severity": "medium",
+            "title": "Competitor mentioned in communications",
+            "description": description,
+        })
 
     # Positive sentiment — create an info-level notification so we still generate a reply
     if not alerts and sentiment > 0.2:
-        positive_signals = []
-        for score in sentiment_scores:
-            positive_signals.extend(score.get("signals", []))
+        # Only the first three signals are shown — don't materialize the rest
+        positive_signals = list(islice(chain.from_iterable(score.get("signals", []) for score in sentiment_scores), 3))
         alerts.append({
             "alert_type": "positive_update",
             "severity": "info",
             "title": f"Positive sentiment from {deal_data.get('client_name', 'client')}",
-            "description": f"Client communication is positive (sentiment: {sentiment:.2f}). " + ("; ".join(positive_signals[:3]) if positive_signals else "Good relationship signals detected."),
+            "description": f"Client communication is positive (sentiment: {sentiment:.2f}). " + ("; ".join(positive_signals) if positive_signals else "Good relationship signals detected."),
         })
 
-    logger.info(f"alert node: alerts generated - alert_count={len(alerts)}")
+    logger.info("alert node: alerts generated - alert_count=%d", len(alerts))
 
     return {
         "detected_alerts": alerts,
@@ -176,6 +288,12 @@ def alert_node(state: MonitoringState) -> Dict[str, Any]:
     }
 
 
+def _sender_name(from_field: str) -> str:
+    """Display name from a From header, or the mailbox part of a bare address."""
+    m = _FROM_RE.match(from_field)
+    return m.group("name") if m else from_field.split("@")[0]
+
+
 def recovery_node(state: MonitoringState) -> Dict[str, Any]:
     """Step 4: Generate reply email — recovery for risks, positive follow-up for good news."""
     logger.info("recovery node: generating email response")
@@ -210,100 +328,43 @@ def recovery_node(state: MonitoringState) -> Dict[str, Any]:
             comms_lines.append(f"From: {from_field}\nSubject: {subj}\nDate: {c.get('date', '')}\n{content}")
             if not sender_email and from_field:
                 sender_email = from_field
-                if "<" in from_field:
-                    sender_name = from_field.split("<")[0].strip().strip('"')
-                else:
-                    sender_name = from_field.split("@")[0]
+                sender_name = _sender_name(from_field)
         comms_summary = "\n---\n".join(comms_lines)
 
     recipient = sender_name or deal_data.get('client_name', 'the client')
 
+    prompt_fields = {
+        "deal_title": deal_data.get('title', 'Unknown'),
+        "client_name": deal_data.get('client_name', 'Unknown'),
+        "deal_value": deal_data.get('deal_value', 'Unknown'),
+        "sentiment": sentiment,
+        "comms_summary": comms_summary or "(No source emails available)",
+        "recipient": recipient,
+        "sender_email": sender_email or 'their email',
+    }
     if is_positive:
-        prompt = f"""You are Quinn, an AI deal intelligence agent. The client has sent a POSITIVE email about the deal. Generate a warm, professional reply to strengthen the relationship.
-
-DEAL: {deal_data.get('title', 'Unknown')}
-CLIENT: {deal_data.get('client_name', 'Unknown')}
-SENTIMENT: {sentiment:.2f} (POSITIVE)
-DEAL VALUE: {deal_data.get('deal_value', 'Unknown')}
-
-SOURCE EMAILS:
-{comms_summary if comms_summary else "(No source emails available)"}
-
-RECIPIENT: {recipient} at {sender_email or 'their email'}
-
-Generate:
-1. A warm, professional reply email to {recipient} that:
-   - Thanks them for the positive feedback
-   - References specific points they mentioned in their email
-   - Reaffirms your commitment to the project
-   - Proposes next steps or expresses excitement about future collaboration
-   - Is well-formatted with separate paragraphs (use \\n\\n between paragraphs)
-   - Starts with a greeting and ends with a professional sign-off
-2. A list of internal action items to capitalize on the positive momentum
-
-Return JSON:
-{{
-    "recovery_email": "Subject: Re: ...\n\nDear {recipient},\n\nThank you paragraph...\n\nSpecific feedback reference...\n\nNext steps...\n\nBest regards,\\n[Name]\\n[Title]",
-    "recovery_actions": [
-        "Action item 1",
-        "Action item 2"
-    ]
-}}
-
-Return ONLY valid JSON."""
+        prompt = POSITIVE_REPLY_PROMPT_TEMPLATE.format(**prompt_fields)
     else:
-        prompt = f"""You are Quinn, an AI deal intelligence agent. Based on these alerts for {deal_data.get('client_name', 'the client')}, generate a recovery strategy.
-
-DEAL: {deal_data.get('title', 'Unknown')}
-CLIENT: {deal_data.get('client_name', 'Unknown')}
-SENTIMENT: {sentiment:.2f}
-DEAL VALUE: {deal_data.get('deal_value', 'Unknown')}
-
-ALERTS:
-{alert_summary}
-
-SOURCE EMAILS THAT TRIGGERED THESE ALERTS:
-{comms_summary if comms_summary else "(No source emails available)"}
+        prompt = RECOVERY_PROMPT_TEMPLATE.format(
+            **prompt_fields,
+            client_label=deal_data.get('client_name', 'the client'),
+            alert_summary=alert_summary,
+            recovery_to=sender_email or deal_data.get('client_name', 'the client'),
+        )
 
-RECIPIENT FOR RECOVERY EMAIL: {sender_email or deal_data.get('client_name', 'the client')}
-
-Provide:
-1. A professional recovery email addressed to {recipient} at {sender_email or 'their email'}. The email should directly address their specific concerns from the source emails above, reaffirm value, and offer concrete next steps.
-   - The email MUST be well-formatted with separate paragraphs (use \\n\\n between paragraphs).
-   - Start with a greeting line (e.g. "Dear [Name],")
-   - Each key point should be its own paragraph
-   - End with a professional sign-off (e.g. "Best regards,\\n[Your Name]\\n[Your Title]")
-2. A list of internal action items for the team
-
-Return JSON:
-{{
-    "recovery_email": "Subject: Re: Concern about ...\n\nDear [Name],\n\nFirst paragraph addressing concern...\n\nSecond paragraph with value proposition...\n\nThird paragraph with next steps...\n\nBest regards,\n[Name]\n[Title]",
-    "recovery_actions": [
-        "Action item 1",
-        "Action item 2"
-    ]
-}}
-
-Return ONLY valid JSON."""
-
-    result_text = call_llm(prompt, max_tokens=2048)
+    result_text = call_llm(prompt, max_tokens=RECOVERY_MAX_TOKENS, cache=True)
 
     try:
-        if "```json" in result_text:
-            result_text = result_text.split("```json")[1].split("```")[0]
-        elif "```" in result_text:
-            result_text = result_text.split("```")[1].split("```")[0]
-
-        result = json.loads(result_text.strip())
+        result = orjson.loads(strip_code_fence(result_text).encode())
         recovery_actions_count = len(result.get("recovery_actions", []))
-        logger.info(f"recovery node: recovery strategy generated - actions_count={recovery_actions_count}")
+        logger.info("recovery node: recovery strategy generated - actions_count=%d", recovery_actions_count)
         return {
             "recovery_email": result.get("recovery_email", ""),
             "recovery_actions": result.get("recovery_actions", []),
             "current_step": "recovery",
         }
-    except (json.JSONDecodeError, IndexError) as e:
-        logger.error(f"recovery node: JSON parsing failed - {str(e)}")
+    except orjson.JSONDecodeError as e:
+        logger.error("recovery node: JSON parsing failed - %s", e)
         return {
             "recovery_email": "",
             "recovery_actions": [],
@@ -316,12 +377,15 @@ def build_monitoring_graph() -> StateGraph:
     workflow = StateGraph(MonitoringState)
 
     workflow.add_node("sentiment", sentiment_node)
+    workflow.add_node("scan", scan_node)
     workflow.add_node("health", health_node)
     workflow.add_node("alert", alert_node)
     workflow.add_node("recovery", recovery_node)
 
-    workflow.set_entry_point("sentiment")
-    workflow.add_edge("sentiment", "health")
+    # The keyword scan runs in parallel with the sentiment LLM call; health waits for both
+    workflow.add_edge(START, "sentiment")
+    workflow.add_edge(START, "scan")
+    workflow.add_edge(["sentiment", "scan"], "health")
     workflow.add_edge("health", "alert")
     workflow.add_edge("alert", "recovery")
     workflow.add_edge("recovery", END)
@@ -329,4 +393,5 @@ def build_monitoring_graph() -> StateGraph:
     return workflow.compile()
 
 
+# Compiled once per process — import this rather than calling build_monitoring_graph()
 monitoring_graph = build_monitoring_graph()
@@ -1,9 +1,15 @@
+import io
+import heapq
+import functools
 import uuid
 import json
 import logging
 import os
-from typing import Dict, Any
-from sqlalchemy.orm import Session
+import orjson
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Any, Tuple
+from sqlalchemy.orm import Session, selectinload
 from app.database import SessionLocal
 from app.models.deal import Deal, DealRequirement, DealAnalysis
 from app.models.document import Document
@@ -11,26 +17,74 @@ from app.models.alert import Alert, RecoveryAction
 from app.models.proposal import Proposal
 from app.models.employee import Employee
 from app.models.assignment import DealAssignment
+from app.models.integration import OAuthToken
+from app.agents.qualification import qualification_graph
+from app.agents.proposal import get_proposal_graph
+from app.agents.monitoring import monitoring_graph
+from app.routers.integrations import get_gmail_client
+from app.mcp.tools.whatsapp_tools import send_deal_risk_alert
 from app.websocket.manager import ws_manager
+from app.agents.task_store import TaskStore
+from app.agents.progress import REPORT_PROGRESS_KEY
+from app.config import settings
 import asyncio
+from collections import OrderedDict, defaultdict
+from itertools import chain
 
 logger = logging.getLogger(__name__)
 
 
-# In-memory task tracking (for hackathon - would use Redis in production)
-task_store: Dict[str, Dict[str, Any]] = {}
+# In-memory task tracking — bounded by TTL and size so finished tasks don't accumulate
+task_store = TaskStore(
+    ttl_seconds=settings.TASK_STORE_TTL_SECONDS,
+    max_tasks=settings.TASK_STORE_MAX_TASKS,
+)
 
-# ── Load ESSHVA company profile once at startup ──
-_company_profile: Dict[str, Any] = {}
+# ── ESSHVA company profile — read from disk on first use, then cached ──
 _profile_path = os.path.join(os.path.dirname(__file__), "..", "data", "esshva_company_profile.json")
-try:
-    with open(os.path.normpath(_profile_path), "r") as f:
-        _company_profile = json.load(f)
-    logger.info(f"Loaded ESSHVA company profile: {_company_profile.get('company', {}).get('brand_name', 'Unknown')}")
-except FileNotFoundError:
-    logger.warning("ESSHVA company profile not found at app/data/esshva_company_profile.json — qualification will use employee data only")
-except json.JSONDecodeError as e:
-    logger.warning(f"Failed to parse company profile JSON: {e}")
+
+
+@functools.lru_cache(maxsize=1)
+def _load_company_profile_sync() -> Dict[str, Any]:
+    try:
+        with open(os.path.normpath(_profile_path), "r") as f:
+            profile = json.load(f)
+        logger.info(f"Loaded ESSHVA company profile: {profile.get('company', {}).get('brand_name', 'Unknown')}")
+        return profile
+    except FileNotFoundError:
+        logger.warning("ESSHVA company profile not found at app/data/esshva_company_profile.json — qualification will use employee data only")
+    except json.JSONDecodeError as e:
+        logger.warning(f"Failed to parse company profile JSON: {e}")
+    return {}
+
+
+async def get_company_profile() -> Dict[str, Any]:
+    """Company profile for the agent prompts; the first call reads the file off the event loop."""
+    return await asyncio.to_thread(_load_company_profile_sync)
+
+
+# How many matched employees are auto-assigned to a qualified deal
+AUTO_ASSIGN_LIMIT = 5
+
+# Keyword tokens for employee matching — lowercase words of 4+ letters
+_WORD_RE = re.compile(r"[a-z]{4,}")
+
+
+async def _db(func, *args, **kwargs):
+    """Run a blocking Session call in a worker thread so the event loop stays free."""
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+
+def _load_active_employees() -> list:
+    """Active employees loaded on a dedicated session (Sessions can't be shared across threads).
+
+    The session is closed before returning; the detached rows keep their loaded columns.
+    """
+    db = SessionLocal()
+    try:
+        return db.query(Employee).filter(Employee.is_active == True).all()
+    finally:
+        db.close()
 
 
 async def send_update(task_id: str, step: str, step_num: int, total: int, status: str, message: str, data: dict = None):
@@ -48,86 +102,271 @@ async def send_update(task_id: str, step: str, step_num: int, total: int, status
     await ws_manager.send_task_update(task_id, update)
 
 
-def _run_graph_sync(graph, initial_state, steps, step_messages, task_id, total_steps):
-    """Run a LangGraph flow synchronously in a thread, updating task_store directly."""
+async def _run_graph_async(graph, initial_state, steps, step_messages, task_id, total_steps):
+    """Stream a LangGraph flow on the event loop, sending an update after each step.
+
+    Sync nodes are run in LangGraph's executor under astream, so blocking LLM calls
+    still don't hold up the loop.
+    """
+    step_index = {name: i + 1 for i, name in enumerate(steps)}
+    loop = asyncio.get_running_loop()
+
+    def report_progress(step: str, message: str, data: dict = None):
+        # Nodes may call this from executor threads — hand the update to the event loop
+        asyncio.run_coroutine_threadsafe(
+            send_update(task_id, step, step_index.get(step, 0), total_steps, "processing", message, data),
+            loop,
+        )
+
+    config = {"configurable": {REPORT_PROGRESS_KEY: report_progress}}
     accumulated = {}
-    for event in graph.stream(initial_state):
+    async for event in graph.astream(initial_state, config=config):
         for node_name, node_output in event.items():
             accumulated.update(node_output)
-            step_idx = steps.index(node_name) + 1 if node_name in steps else 0
-            # Update task_store directly (thread-safe in CPython due to GIL)
-            task_store[task_id] = {
-                "task_id": task_id,
-                "step": node_name,
-                "step_number": step_idx,
-                "total_steps": total_steps,
-                "status": "processing",
-                "message": step_messages.get(node_name, f"Processing {node_name}..."),
-                "data": {},
-            }
+            step_idx = step_index.get(node_name)
+            if step_idx is None:
+                # Helper branches (e.g. monitoring keyword scan) don't count as progress steps
+                continue
+            await send_update(
+                task_id, node_name, step_idx, total_steps, "processing",
+                step_messages.get(node_name, f"Processing {node_name}..."),
+            )
     return accumulated
 
 
-async def run_qualification_flow(task_id: str, deal_id: str, document_id: str = None):
-    """Execute the qualification agent flow."""
-    logger.info(f"run_qualification_flow: starting qualification flow for deal_id={deal_id}")
-    from app.agents.qualification import qualification_graph
+async def _run_graph_detached(db, deal_id, graph, initial_state, steps, step_messages, task_id, total_steps):
+    """Run a graph without holding a pooled connection for the (LLM-bound) duration.
+
+    The session is closed first — rows already loaded stay readable — and the deal
+    is re-fetched afterwards so results are persisted on a fresh transaction.
+    Returns (result, deal); deal is None if it was deleted while the graph ran.
+    """
+    await _db(db.close)
+    result = await _run_graph_async(graph, initial_state, steps, step_messages, task_id, total_steps)
+    deal = await _db(db.get, Deal, deal_id)
+    return result, deal
+
+
+def _match_employees(employees, required_keywords, limit: int = AUTO_ASSIGN_LIMIT) -> Tuple[list, int]:
+    """Score employees by how many required keywords appear in their skills / role words.
+
+    Builds an inverted index term → employee positions, so each employee is only
+    touched for the keywords they actually match. Returns the ``limit`` best
+    matches (best first) and the total number of employees that matched at all.
+    """
+    inverted = defaultdict(list)
+    for idx, emp in enumerate(employees):
+        terms = {s.lower() for s in (emp.skills or [])}
+        terms.update(w.lower() for w in (emp.role or "").split() if len(w) > 3)
+        for term in terms:
+            inverted[term].append(idx)
+
+    overlaps = defaultdict(list)
+    for keyword in required_keywords:
+        for idx in inverted.get(keyword, ()):
+            overlaps[idx].append(keyword)
+
+    # Only the winners get output dicts; ties keep employee order
+    top = heapq.nlargest(limit, overlaps, key=lambda idx: (len(overlaps[idx]), -idx))
+    matched_staff = []
+    for idx in top:
+        emp = employees[idx]
+        matched_staff.append({
+            "employee_id": emp.id,
+            "name": emp.name,
+            "role": emp.role,
+            "skills": emp.skills or [],
+            "matching_skills": overlaps[idx],
+            "match_score": len(overlaps[idx]),
+            "availability_percent": emp.availability_percent,
+            "hourly_rate": emp.hourly_rate,
+        })
+    return matched_staff, len(overlaps)
+
+
+# Recent match results keyed by (employee fingerprint, keyword set). Only touched
+# from the event loop, so no lock is needed.
+_MATCH_CACHE_SIZE = 256
+_match_cache: "OrderedDict[tuple, Tuple[list, int]]" = OrderedDict()
+
+
+def _employees_version(employees) -> int:
+    """Fingerprint of exactly the employee fields _match_employees reads (in load order).
+
+    Built from the values themselves rather than updated_at, whose resolution and
+    transaction-start semantics can leave an edit's timestamp unchanged.
+    """
+    return hash(tuple(
+        (e.id, e.name, e.role, tuple(e.skills or ()), e.availability_percent, e.hourly_rate)
+        for e in employees
+    ))
+
+
+def _copy_matches(matched: Tuple[list, int]) -> Tuple[list, int]:
+    """Fresh staff dicts (and their lists), so callers can't mutate a cached result."""
+    staff, count = matched
+    return [
+        {**entry, "skills": list(entry["skills"]), "matching_skills": list(entry["matching_skills"])}
+        for entry in staff
+    ], count
+
+
+def _match_employees_cached(employees, required_keywords) -> Tuple[list, int]:
+    """_match_employees, memoized across re-qualifications with the same staff and keywords."""
+    key = (_employees_version(employees), frozenset(required_keywords))
+    cached = _match_cache.get(key)
+    if cached is not None:
+        _match_cache.move_to_end(key)
+        return _copy_matches(cached)
+    matched = _match_employees(employees, required_keywords)
+    _match_cache[key] = matched
+    if len(_match_cache) > _MATCH_CACHE_SIZE:
+        _match_cache.popitem(last=False)
+    return _copy_matches(matched)
+
+
+async def _run_flow(flow_name, graph, deal_id, task_id, steps, step_messages, build_state, persist_result, load_deal=None):
+    """Shared lifecycle of an agent flow: load deal → build state → run graph → persist.
+
+    ``build_state(db, deal)`` returns the flow-specific initial state (the common
+    deal_id/task_id/bookkeeping keys are added here) or None to stop early — it sends
+    its own final update in that case. ``persist_result(db, deal, result)`` writes the
+    graph output on a fresh transaction and sends the completion update.
+    ``load_deal(db)`` overrides the plain deal lookup when a flow needs eager loads.
+    Any exception rolls back and reports the task as failed; the session is always closed.
+    """
+    log_prefix = f"run_{flow_name}_flow"
+    total_steps = len(steps)
+    logger.info(f"{log_prefix}: starting {flow_name} flow for deal_id={deal_id}")
 
     db = SessionLocal()
     try:
-        deal = db.query(Deal).filter(Deal.id == deal_id).first()
+        if load_deal is not None:
+            deal = await load_deal(db)
+        else:
+            deal = await _db(lambda: db.query(Deal).filter(Deal.id == deal_id).first())
+        if not deal:
+            logger.error(f"{log_prefix}: deal not found - deal_id={deal_id}")
+            await send_update(task_id, "error", 0, total_steps, "failed", "Deal not found")
+            return
+
+        state = await build_state(db, deal)
+        if state is None:
+            return
+        initial_state = {
+            "deal_id": deal_id,
+            "task_id": task_id,
+            **state,
+            "current_step": "",
+            "messages": [],
+            "errors": [],
+        }
+
+        result, deal = await _run_graph_detached(
+            db, deal_id, graph, initial_state, steps, step_messages, task_id, total_steps
+        )
         if not deal:
-            logger.error(f"run_qualification_flow: deal not found - deal_id={deal_id}")
-            await send_update(task_id, "error", 0, 5, "failed", "Deal not found")
+            logger.error(f"{log_prefix}: deal deleted while the flow was running - deal_id={deal_id}")
+            await send_update(task_id, "error", 0, total_steps, "failed", "Deal not found")
             return
+        if result:
+            await persist_result(db, deal, result)
+    except Exception as e:
+        logger.error(f"{log_prefix}: exception occurred - {type(e).__name__}: {e}")
+        await _db(db.rollback)
+        await send_update(task_id, "error", 0, total_steps, "failed", f"Error: {str(e)}")
+    finally:
+        await _db(db.close)
 
+
+QUALIFICATION_STEPS = (
+    ["ingest", "extract_and_analyze", "match", "decide"]
+    if settings.QUALIFICATION_FUSED_EXTRACT
+    else ["ingest", "extract", "analyze", "match", "decide"]
+)
+QUALIFICATION_STEP_MESSAGES = {
+    "ingest": "Parsing document structure...",
+    "extract": "Extracting requirements and entities...",
+    "analyze": "Analyzing deal viability...",
+    "extract_and_analyze": "Extracting requirements and analyzing deal viability...",
+    "match": "Matching employee skills...",
+    "decide": "Generating GO/NO-GO recommendation...",
+}
+
+
+async def run_qualification_flow(task_id: str, deal_id: str, document_id: str = None):
+    """Execute the qualification agent flow."""
+    total_steps = len(QUALIFICATION_STEPS)
+    all_employees = []
+
+    async def load_deal(db):
+        nonlocal all_employees
+        # Deal + all of its documents in one round-trip, concurrently with the
+        # (independent) active-employee fetch on its own session
+        deal, all_employees = await asyncio.gather(
+            _db(lambda: (
+                db.query(Deal)
+                .options(selectinload(Deal.documents))
+                .filter(Deal.id == deal_id)
+                .first()
+            )),
+            _db(_load_active_employees),
+        )
+        return deal
+
+    async def build_state(db, deal):
         # Get ALL processed documents for this deal
-        all_docs = (
-            db.query(Document)
-            .filter(Document.deal_id == deal_id, Document.is_processed == True)
-            .order_by(Document.created_at.asc())
-            .all()
+        all_docs = sorted(
+            (d for d in deal.documents if d.is_processed),
+            key=lambda d: d.created_at,
         )
 
         # If a specific document_id was given, make sure it's included
-        if document_id and not any(d.id == document_id for d in all_docs):
-            specific_doc = db.query(Document).filter(Document.id == document_id).first()
+        doc_ids = {d.id for d in all_docs}
+        if document_id and document_id not in doc_ids:
+            specific_doc = next((d for d in deal.documents if d.id == document_id), None)
+            if specific_doc is None:
+                specific_doc = await _db(lambda: db.query(Document).filter(Document.id == document_id).first())
             if specific_doc and specific_doc.extracted_text:
                 all_docs.insert(0, specific_doc)
 
         if not all_docs:
             logger.error(f"run_qualification_flow: no processed documents found - deal_id={deal_id}")
-            await send_update(task_id, "error", 0, 5, "failed", "No processed documents found for this deal")
-            return
+            await send_update(task_id, "error", 0, total_steps, "failed", "No processed documents found for this deal")
+            return None
 
         logger.info(f"run_qualification_flow: found {len(all_docs)} documents for qualification")
 
-        # Combine all document texts with clear separators
-        doc_parts = []
+        # Combine all document texts with clear separators — written straight into one
+        # buffer so we don't hold a list of per-document strings alongside the result
+        buf = io.StringIO()
         doc_metadata = {"document_count": len(all_docs), "documents": []}
         for doc in all_docs:
-            if doc.extracted_text:
-                category_label = (doc.doc_category or "general").upper()
-                source_title = (doc.extraction_metadata or {}).get("title", doc.original_filename or doc.filename)
-                doc_parts.append(f"=== [{category_label}] {source_title} ===\n{doc.extracted_text}")
-                doc_metadata["documents"].append({
-                    "id": doc.id,
-                    "filename": doc.original_filename or doc.filename,
-                    "category": doc.doc_category,
-                    "size": doc.file_size,
-                })
-
-        doc_text = "\n\n".join(doc_parts)
+            if not doc.extracted_text:
+                continue
+            if doc_metadata["documents"]:
+                buf.write("\n\n")
+            category_label = (doc.doc_category or "general").upper()
+            source_title = (doc.extraction_metadata or {}).get("title", doc.original_filename or doc.filename)
+            buf.write(f"=== [{category_label}] {source_title} ===\n")
+            buf.write(doc.extracted_text)
+            doc_metadata["documents"].append({
+                "id": doc.id,
+                "filename": doc.original_filename or doc.filename,
+                "category": doc.doc_category,
+                "size": doc.file_size,
+            })
+
+        doc_text = buf.getvalue()
 
         if not doc_text.strip():
             logger.error(f"run_qualification_flow: documents found but no text extracted - deal_id={deal_id}")
-            await send_update(task_id, "error", 0, 5, "failed", "Documents found but no text could be extracted")
-            return
+            await send_update(task_id, "error", 0, total_steps, "failed", "Documents found but no text could be extracted")
+            return None
 
-        await send_update(task_id, "ingest", 1, 5, "processing", f"Ingesting {len(all_docs)} document(s)...")
+        await send_update(task_id, "ingest", 1, total_steps, "processing", f"Ingesting {len(all_docs)} document(s)...")
 
-        # ── Fetch real employee capabilities for gap analysis ──
-        all_employees = db.query(Employee).filter(Employee.is_active == True).all()
+        # ── Real employee capabilities for gap analysis (reused for matching below) ──
         employee_capabilities = []
         all_skills_set = set()
         all_departments = set()
@@ -146,16 +385,13 @@ async def run_qualification_flow(task_id: str, deal_id: str, document_id: str =
             })
         logger.info(f"run_qualification_flow: loaded {len(employee_capabilities)} employees with {len(all_skills_set)} unique skills for capability analysis")
 
-        # Run the LangGraph flow
-        initial_state = {
-            "deal_id": deal_id,
-            "task_id": task_id,
+        return {
             "document_text": doc_text,
             "document_metadata": doc_metadata,
             "extracted_requirements": [],
             "extracted_entities": {},
             "employee_capabilities": employee_capabilities,
-            "company_profile": _company_profile,
+            "company_profile": await get_company_profile(),
             "skill_matches": [],
             "gap_analysis": {},
             "recommendation": "",
@@ -164,167 +400,133 @@ async def run_qualification_flow(task_id: str, deal_id: str, document_id: str =
             "risk_factors": [],
             "conditions": [],
             "reasoning": "",
-            "current_step": "",
-            "messages": [],
-            "errors": [],
-        }
-
-        steps = ["ingest", "extract", "analyze", "match", "decide"]
-        step_messages = {
-            "ingest": "Parsing document structure...",
-            "extract": "Extracting requirements and entities...",
-            "analyze": "Analyzing deal viability...",
-            "match": "Matching employee skills...",
-            "decide": "Generating GO/NO-GO recommendation...",
         }
 
-        # Run blocking graph in a thread so we don't block the event loop
-        accumulated = await asyncio.to_thread(
-            _run_graph_sync, qualification_graph, initial_state, steps, step_messages, task_id, 5
+    async def persist_result(db, deal, result):
+        requirements_found = len(result.get("extracted_requirements", []))
+        logger.info(f"run_qualification_flow: qualification flow completed - requirements_found={requirements_found}")
+
+        # Save requirements to DB (single multi-row INSERT)
+        await _db(db.bulk_insert_mappings, DealRequirement, [
+            {
+                "id": uuid.uuid4().hex,
+                "deal_id": deal_id,
+                "category": req.get("category", "technical"),
+                "requirement_text": req.get("text", ""),
+                "confidence": req.get("confidence", 0.5),
+            }
+            for req in result.get("extracted_requirements", [])
+        ])
+
+        # Save analysis to DB
+        analysis = DealAnalysis(
+            id=uuid.uuid4().hex,
+            deal_id=deal_id,
+            analysis_type="qualification",
+            recommendation=result.get("recommendation", "no_go"),
+            confidence_score=result.get("confidence_score", 0.0),
+            positive_factors=result.get("positive_factors", []),
+            risk_factors=result.get("risk_factors", []),
+            conditions=result.get("conditions", []),
+            reasoning=result.get("reasoning", ""),
         )
+        db.add(analysis)
+
+        # Real employee matching against extracted requirements + gap analysis
+        gap_analysis = result.get("gap_analysis", {})
+        key_roles = gap_analysis.get("resource_estimate", {}).get("key_roles", [])
+
+        matched_staff = []
+        matched_count = 0
+        if all_employees:
+            # Build skill keywords from requirements + gap analysis in one tokenizing pass
+            requirements = result.get("extracted_requirements", [])
+            blob = " ".join(chain(
+                (req.get("text", "") for req in requirements),
+                (req.get("category", "") for req in requirements),
+                gap_analysis.get("strong_areas", []),
+                gap_analysis.get("gap_areas", []),
+                key_roles,
+            )).lower()
+            required_keywords = set(_WORD_RE.findall(blob))
+
+            if not required_keywords:
+                logger.info("run_qualification_flow: no requirement keywords extracted - skipping employee matching")
+            else:
+                # Employees with no skills and no 4+ letter role words can never score
+                scorable = [
+                    e for e in all_employees
+                    if e.skills or any(len(w) > 3 for w in (e.role or "").split())
+                ]
+                matched_staff, matched_count = _match_employees_cached(scorable, required_keywords)
+
+        # Auto-assign the top matched employees to the deal
+        auto_assigned = 0
+        if matched_staff:
+            # Clear any previous auto-assignments for this deal
+            await _db(lambda: db.query(DealAssignment).filter(
+                DealAssignment.deal_id == deal_id,
+                DealAssignment.assigned_by == "auto",
+            ).delete())
+
+            assignment_rows = [
+                {
+                    "id": uuid.uuid4().hex,
+                    "deal_id": deal_id,
+                    "employee_id": staff["employee_id"],
+                    "role_on_deal": staff["role"],
+                    "allocation_percent": min(staff.get("availability_percent", 100), 100),
+                    "assigned_by": "auto",
+                    "match_score": staff["match_score"],
+                }
+                for staff in matched_staff
+            ]
+            await _db(db.bulk_insert_mappings, DealAssignment, assignment_rows)
+            auto_assigned = len(assignment_rows)
 
-        result = accumulated
-        if result:
-            requirements_found = len(result.get("extracted_requirements", []))
-            logger.info(f"run_qualification_flow: qualification flow completed - requirements_found={requirements_found}")
-
-            # Save requirements to DB
-            for req in result.get("extracted_requirements", []):
-                db_req = DealRequirement(
-                    id=str(uuid.uuid4()),
-                    deal_id=deal_id,
-                    category=req.get("category", "technical"),
-                    requirement_text=req.get("text", ""),
-                    confidence=req.get("confidence", 0.5),
-                )
-                db.add(db_req)
-
-            # Save analysis to DB
-            analysis = DealAnalysis(
-                id=str(uuid.uuid4()),
-                deal_id=deal_id,
-                analysis_type="qualification",
-                recommendation=result.get("recommendation", "no_go"),
-                confidence_score=result.get("confidence_score", 0.0),
-                positive_factors=result.get("positive_factors", []),
-                risk_factors=result.get("risk_factors", []),
-                conditions=result.get("conditions", []),
-                reasoning=result.get("reasoning", ""),
-            )
-            db.add(analysis)
-
-            # Real employee matching against extracted requirements + gap analysis
-            gap_analysis = result.get("gap_analysis", {})
-            key_roles = gap_analysis.get("resource_estimate", {}).get("key_roles", [])
-            all_employees = db.query(Employee).filter(Employee.is_active == True).all()
-
-            matched_staff = []
-            if all_employees:
-                # Build skill keywords from requirements + gap analysis
-                required_keywords = set()
-                for req in result.get("extracted_requirements", []):
-                    text = req.get("text", "").lower()
-                    for word in text.split():
-                        if len(word) > 3:
-                            required_keywords.add(word)
-                    required_keywords.add(req.get("category", "").lower())
-
-                for area in gap_analysis.get("strong_areas", []) + gap_analysis.get("gap_areas", []):
-                    for word in area.lower().split():
-                        if len(word) > 3:
-                            required_keywords.add(word)
-
-                for role in key_roles:
-                    for word in role.lower().split():
-                        if len(word) > 3:
-                            required_keywords.add(word)
-
-                # Score each employee
-                for emp in all_employees:
-                    emp_skills = {s.lower() for s in (emp.skills or [])}
-                    emp_role_words = {w.lower() for w in emp.role.split() if len(w) > 3}
-                    all_emp_terms = emp_skills | emp_role_words
-                    overlap = all_emp_terms & required_keywords
-                    if overlap:
-                        matched_staff.append({
-                            "employee_id": emp.id,
-                            "name": emp.name,
-                            "role": emp.role,
-                            "skills": emp.skills or [],
-                            "matching_skills": list(overlap),
-                            "match_score": len(overlap),
-                            "availability_percent": emp.availability_percent,
-                            "hourly_rate": emp.hourly_rate,
-                        })
-
-                matched_staff.sort(key=lambda x: x["match_score"], reverse=True)
-
-            # Auto-assign top 5 matched employees to the deal
-            auto_assigned = 0
-            if matched_staff:
-                # Clear any previous auto-assignments for this deal
-                db.query(DealAssignment).filter(
-                    DealAssignment.deal_id == deal_id,
-                    DealAssignment.assigned_by == "auto",
-                ).delete()
-
-                for staff in matched_staff[:5]:
-                    assignment = DealAssignment(
-                        id=str(uuid.uuid4()),
-                        deal_id=deal_id,
-                        employee_id=staff["employee_id"],
-                        role_on_deal=staff["role"],
-                        allocation_percent=min(staff.get("availability_percent", 100), 100),
-                        assigned_by="auto",
-                        match_score=staff["match_score"],
-                    )
-                    db.add(assignment)
-                    auto_assigned += 1
-
-            # Update deal stage
-            deal.stage = "qualification"
-            db.commit()
-
-            logger.info(f"run_qualification_flow: final result - recommendation={result.get('recommendation')}, employees_matched={len(matched_staff)}, auto_assigned={auto_assigned}")
-
-            await send_update(task_id, "complete", 5, 5, "completed", "Qualification complete", {
-                "recommendation": result.get("recommendation"),
-                "confidence_score": result.get("confidence_score"),
-                "requirements_found": len(result.get("extracted_requirements", [])),
-                "matched_employees": len(matched_staff),
-                "auto_assigned": auto_assigned,
-                "key_roles": key_roles,
-            })
-    except Exception as e:
-        logger.error(f"run_qualification_flow: exception occurred - {type(e).__name__}: {e}")
-        db.rollback()
-        await send_update(task_id, "error", 0, 5, "failed", f"Error: {str(e)}")
-    finally:
-        db.close()
+        # Update deal stage
+        deal.stage = "qualification"
+        await _db(db.commit)
+
+        logger.info(f"run_qualification_flow: final result - recommendation={result.get('recommendation')}, employees_matched={matched_count}, auto_assigned={auto_assigned}")
+
+        await send_update(task_id, "complete", total_steps, total_steps, "completed", "Qualification complete", {
+            "recommendation": result.get("recommendation"),
+            "confidence_score": result.get("confidence_score"),
+            "requirements_found": len(result.get("extracted_requirements", [])),
+            "matched_employees": matched_count,
+            "auto_assigned": auto_assigned,
+            "key_roles": key_roles,
+        })
+
+    await _run_flow(
+        "qualification", qualification_graph, deal_id, task_id,
+        QUALIFICATION_STEPS, QUALIFICATION_STEP_MESSAGES,
+        build_state, persist_result, load_deal=load_deal,
+    )
+
+
+PROPOSAL_STEPS = ["retrieve", "generate", "comply"]
+PROPOSAL_STEP_MESSAGES = {
+    "retrieve": "Searching knowledge base for relevant proposal sections...",
+    "generate": "Generating proposal draft...",
+    "comply": "Checking compliance against requirements...",
+}
 
 
 async def run_proposal_flow(task_id: str, deal_id: str):
     """Execute the proposal generation agent flow."""
-    logger.info(f"run_proposal_flow: starting proposal flow for deal_id={deal_id}")
-    from app.agents.proposal import proposal_graph
-
-    db = SessionLocal()
-    try:
-        deal = db.query(Deal).filter(Deal.id == deal_id).first()
-        if not deal:
-            logger.error(f"run_proposal_flow: deal not found - deal_id={deal_id}")
-            await send_update(task_id, "error", 0, 3, "failed", "Deal not found")
-            return
 
-        requirements = db.query(DealRequirement).filter(DealRequirement.deal_id == deal_id).all()
+    async def build_state(db, deal):
+        requirements = await _db(lambda: db.query(DealRequirement).filter(DealRequirement.deal_id == deal_id).all())
 
         # ── Fetch assigned employees for this deal ──
-        assignments = (
+        assignments = await _db(lambda: (
             db.query(DealAssignment, Employee)
             .join(Employee, DealAssignment.employee_id == Employee.id)
             .filter(DealAssignment.deal_id == deal_id)
             .all()
-        )
+        ))
         team_data = []
         for assignment, emp in assignments:
             team_data.append({
@@ -340,9 +542,7 @@ async def run_proposal_flow(task_id: str, deal_id: str):
 
         await send_update(task_id, "retrieve", 1, 3, "processing", "Quinn is retrieving relevant proposal context...")
 
-        initial_state = {
-            "deal_id": deal_id,
-            "task_id": task_id,
+        return {
             "deal_context": {
                 "title": deal.title,
                 "client_name": deal.client_name,
@@ -354,83 +554,74 @@ async def run_proposal_flow(task_id: str, deal_id: str):
                 for r in requirements
             ],
             "team_assignments": team_data,
-            "company_profile": _company_profile,
+            "company_profile": await get_company_profile(),
             "retrieved_sections": [],
+            "prompt_parts": {},
             "proposal_draft": "",
             "proposal_sections": [],
             "compliance_score": 0.0,
             "compliance_issues": [],
             "final_proposal": "",
             "proposal_id": "",
-            "current_step": "",
-            "messages": [],
-            "errors": [],
-        }
-
-        steps = ["retrieve", "generate", "comply"]
-        step_messages = {
-            "retrieve": "Searching knowledge base for relevant proposal sections...",
-            "generate": "Generating proposal draft...",
-            "comply": "Checking compliance against requirements...",
         }
 
-        # Run blocking graph in a thread so we don't block the event loop
-        result = await asyncio.to_thread(
-            _run_graph_sync, proposal_graph, initial_state, steps, step_messages, task_id, 3
+    async def persist_result(db, deal, result):
+        compliance_score = result.get("compliance_score", 0.0)
+        logger.info(f"run_proposal_flow: proposal flow completed - compliance_score={compliance_score}")
+
+        # Read before the commit — it expires loaded attributes, and reloading them
+        # would be a blocking query on the event loop
+        proposal_id = uuid.uuid4().hex
+        proposal = Proposal(
+            id=proposal_id,
+            deal_id=deal_id,
+            title=f"Proposal - {deal.client_name} - {deal.title}",
+            content=result.get("final_proposal") or result.get("proposal_draft", ""),
+            compliance_score=compliance_score,
+            compliance_notes=result.get("compliance_issues", []),
+            generated_by="esshva",
+            status="draft",
         )
-        if result:
-            compliance_score = result.get("compliance_score", 0.0)
-            logger.info(f"run_proposal_flow: proposal flow completed - compliance_score={compliance_score}")
-
-            proposal = Proposal(
-                id=str(uuid.uuid4()),
-                deal_id=deal_id,
-                title=f"Proposal - {deal.client_name} - {deal.title}",
-                content=result.get("final_proposal") or result.get("proposal_draft", ""),
-                compliance_score=compliance_score,
-                compliance_notes=result.get("compliance_issues", []),
-                generated_by="esshva",
-                status="draft",
-            )
-            db.add(proposal)
-            deal.stage = "proposal"
-            db.commit()
+        db.add(proposal)
+        deal.stage = "proposal"
+        await _db(db.commit)
+
+        await send_update(task_id, "complete", 3, 3, "completed", "Proposal generated", {
+            "proposal_id": proposal_id,
+            "compliance_score": compliance_score,
+        })
+
+    await _run_flow(
+        "proposal", get_proposal_graph(), deal_id, task_id,
+        PROPOSAL_STEPS, PROPOSAL_STEP_MESSAGES,
+        build_state, persist_result,
+    )
 
-            await send_update(task_id, "complete", 3, 3, "completed", "Proposal generated", {
-                "proposal_id": proposal.id,
-                "compliance_score": compliance_score,
-            })
-    except Exception as e:
-        logger.error(f"run_proposal_flow: exception occurred - {type(e).__name__}: {e}")
-        db.rollback()
-        await send_update(task_id, "error", 0, 3, "failed", f"Error: {str(e)}")
-    finally:
-        db.close()
+
+MONITORING_STEPS = ["sentiment", "health", "alert", "recovery"]
+MONITORING_STEP_MESSAGES = {
+    "sentiment": "Analyzing communication sentiment...",
+    "health": "Calculating deal health score...",
+    "alert": "Detecting potential risks...",
+    "recovery": "Generating recovery strategy...",
+}
 
 
 async def run_monitoring_flow(task_id: str, deal_id: str):
     """Execute the monitoring agent flow."""
-    logger.info(f"run_monitoring_flow: starting monitoring flow for deal_id={deal_id}")
-    from app.agents.monitoring import monitoring_graph
-
-    db = SessionLocal()
-    try:
-        deal = db.query(Deal).filter(Deal.id == deal_id).first()
-        if not deal:
-            logger.error(f"run_monitoring_flow: deal not found - deal_id={deal_id}")
-            await send_update(task_id, "error", 0, 4, "failed", "Deal not found")
-            return
+    real_comms = []
 
+    async def build_state(db, deal):
+        nonlocal real_comms
         await send_update(task_id, "sentiment", 1, 4, "processing", "Fetching emails from Gmail...")
 
         # ── Determine time window: only fetch emails since the last monitoring run ──
-        from datetime import datetime, timedelta
-        last_alert = (
+        last_alert = await _db(lambda: (
             db.query(Alert)
             .filter(Alert.deal_id == deal_id)
             .order_by(Alert.created_at.desc())
             .first()
-        )
+        ))
         if last_alert and last_alert.created_at:
             # Fetch emails newer than the last alert (with 1-hour overlap buffer)
             since_dt = last_alert.created_at - timedelta(hours=1)
@@ -442,12 +633,9 @@ async def run_monitoring_flow(task_id: str, deal_id: str):
             logger.info(f"run_monitoring_flow: no previous alerts, fetching emails after {after_filter}")
 
         # ── Fetch real emails from Gmail ──
-        real_comms = []
         no_emails_reason = None
         try:
-            from app.routers.integrations import get_gmail_client
-            from app.models.integration import OAuthToken
-            oauth = db.query(OAuthToken).filter(OAuthToken.provider == "google").first()
+            oauth = await _db(lambda: db.query(OAuthToken).filter(OAuthToken.provider == "google").first())
             if not oauth:
                 no_emails_reason = "Gmail not connected. Connect your Google account in Settings."
                 logger.warning("run_monitoring_flow: no Google OAuth token found")
@@ -475,22 +663,20 @@ async def run_monitoring_flow(task_id: str, deal_id: str):
                         if emails:
                             logger.info(f"run_monitoring_flow: using {len(emails)} recent emails as fallback")
 
-                    # Convert to comms format and sort newest-first
-                    for e in emails:
-                        real_comms.append({
+                    # Sort by date descending (newest first) — Gmail returns newest first
+                    # but we make it explicit in case of mixed sources
+                    emails.sort(key=lambda e: e.get("date", ""), reverse=True)
+                    # Convert to comms format
+                    real_comms = [
+                        {
                             "type": "email",
                             "date": e.get("date", "")[:10],
                             "from": e.get("from", ""),
                             "subject": e.get("subject", ""),
                             "content": e.get("preview", ""),
-                            "raw_date": e.get("date", ""),
-                        })
-                    # Sort by date descending (newest first) — Gmail returns newest first
-                    # but we make it explicit in case of mixed sources
-                    real_comms.sort(key=lambda x: x.get("raw_date", ""), reverse=True)
-                    # Remove raw_date helper field
-                    for c in real_comms:
-                        c.pop("raw_date", None)
+                        }
+                        for e in emails
+                    ]
 
                     if not real_comms:
                         no_emails_reason = f"No new emails found for '{client_name}' since last monitoring run."
@@ -509,11 +695,9 @@ async def run_monitoring_flow(task_id: str, deal_id: str):
                 "alerts_generated": 0,
                 "no_emails_reason": no_emails_reason,
             })
-            return
+            return None
 
-        initial_state = {
-            "deal_id": deal_id,
-            "task_id": task_id,
+        return {
             "deal_data": {
                 "title": deal.title,
                 "client_name": deal.client_name,
@@ -522,6 +706,7 @@ async def run_monitoring_flow(task_id: str, deal_id: str):
                 "stage": deal.stage,
             },
             "recent_communications": real_comms,
+            "keyword_hits": [],
             "sentiment_scores": [],
             "overall_sentiment": 0.0,
             "health_score": 70,
@@ -529,117 +714,109 @@ async def run_monitoring_flow(task_id: str, deal_id: str):
             "detected_alerts": [],
             "recovery_email": "",
             "recovery_actions": [],
-            "current_step": "",
-            "messages": [],
-            "errors": [],
-        }
-
-        steps = ["sentiment", "health", "alert", "recovery"]
-        step_messages = {
-            "sentiment": "Analyzing communication sentiment...",
-            "health": "Calculating deal health score...",
-            "alert": "Detecting potential risks...",
-            "recovery": "Generating recovery strategy...",
         }
 
-        # Run blocking graph in a thread so we don't block the event loop
-        result = await asyncio.to_thread(
-            _run_graph_sync, monitoring_graph, initial_state, steps, step_messages, task_id, 4
-        )
-        if result:
-            health_score = result.get("health_score", deal.health_score)
-            alerts_count = len(result.get("detected_alerts", []))
-            logger.info(f"run_monitoring_flow: monitoring flow completed - email_count={len(real_comms)}, health_score={health_score}, alerts_count={alerts_count}")
-
-            # Parse recovery email into subject + body
-            raw_email = result.get("recovery_email", "")
-            email_subject = ""
-            email_body = raw_email
-            if raw_email:
-                # LLM often returns "Subject: ...\n\nBody..."
-                lines = raw_email.strip().split("\n", 1)
-                first_line = lines[0].strip()
-                if first_line.lower().startswith("subject:"):
-                    email_subject = first_line[len("subject:"):].strip()
-                    email_body = lines[1].strip() if len(lines) > 1 else ""
-                else:
-                    # No explicit subject line — use first sentence
-                    email_subject = "Re: " + deal.title
-                    email_body = raw_email
-                logger.info(f"run_monitoring_flow: recovery email parsed - subject='{email_subject[:60]}', body_len={len(email_body)}")
-
-            # Serialize source emails for audit trail
-            source_emails_json = json.dumps(real_comms) if real_comms else None
-
-            # Save alerts to DB
-            for alert_data in result.get("detected_alerts", []):
-                alert = Alert(
-                    id=str(uuid.uuid4()),
-                    deal_id=deal_id,
+    async def persist_result(db, deal, result):
+        health_score = result.get("health_score", deal.health_score)
+        alerts_count = len(result.get("detected_alerts", []))
+        logger.info(f"run_monitoring_flow: monitoring flow completed - email_count={len(real_comms)}, health_score={health_score}, alerts_count={alerts_count}")
+
+        # Parse recovery email into subject + body
+        raw_email = result.get("recovery_email", "")
+        email_subject = ""
+        email_body = raw_email
+        if raw_email:
+            # LLM often returns "Subject: ...\n\nBody..."
+            lines = raw_email.strip().split("\n", 1)
+            first_line = lines[0].strip()
+            if first_line.lower().startswith("subject:"):
+                email_subject = first_line[len("subject:"):].strip()
+                email_body = lines[1].strip() if len(lines) > 1 else ""
+            else:
+                # No explicit subject line — use first sentence
+                email_subject = "Re: " + deal.title
+                email_body = raw_email
+            logger.info(f"run_monitoring_flow: recovery email parsed - subject='{email_subject[:60]}', body_len={len(email_body)}")
+
+        # Serialize source emails for audit trail
+        source_emails_json = orjson.dumps(real_comms).decode() if real_comms else None
+
+        # Save alerts + recovery actions to DB — ids are generated here so actions
+        # can reference their alert without a flush in between
+        alert_rows = []
+        action_rows = []
+        for alert_data in result.get("detected_alerts", []):
+            alert_id = uuid.uuid4().hex
+            alert_rows.append({
+                "id": alert_id,
+                "deal_id": deal_id,
+                "alert_type": alert_data.get("alert_type", "sentiment_drop"),
+                "severity": alert_data.get("severity", "medium"),
+                "title": alert_data.get("title", "Alert"),
+                "description": alert_data.get("description", ""),
+                "sentiment_score": result.get("overall_sentiment"),
+                "source_context": source_emails_json,
+                "email_subject": email_subject,
+                "email_body": email_body,
+            })
+            action_rows.extend(
+                {"id": uuid.uuid4().hex, "alert_id": alert_id, "action_text": action_text, "priority": i + 1}
+                for i, action_text in enumerate(result.get("recovery_actions", []))
+            )
+        await _db(db.bulk_insert_mappings, Alert, alert_rows)
+        await _db(db.bulk_insert_mappings, RecoveryAction, action_rows)
+
+        # Read before the commit — it expires the deal, and reloading it would be
+        # a blocking query on the event loop
+        deal_title = deal.title
+        client_name = deal.client_name or "Unknown"
+
+        # Update deal health
+        deal.health_score = health_score
+        if result.get("detected_alerts"):
+            deal.status = "at_risk"
+        await _db(db.commit)
+
+        # ── WhatsApp alert for critical/high severity risks ──
+        risk_alerts = [
+            a for a in result.get("detected_alerts", [])
+            if a.get("severity") in ("critical", "high")
+        ]
+        if risk_alerts:
+            # Twilio client is blocking — send the burst concurrently from worker threads
+            wa_results = await asyncio.gather(*(
+                asyncio.to_thread(
+                    send_deal_risk_alert,
+                    deal_title=deal_title,
+                    client_name=client_name,
                     alert_type=alert_data.get("alert_type", "sentiment_drop"),
-                    severity=alert_data.get("severity", "medium"),
-                    title=alert_data.get("title", "Alert"),
+                    severity=alert_data.get("severity", "high"),
+                    health_score=health_score,
+                    sentiment_score=result.get("overall_sentiment", 0.0),
                     description=alert_data.get("description", ""),
-                    sentiment_score=result.get("overall_sentiment"),
-                    source_context=source_emails_json,
-                    email_subject=email_subject,
-                    email_body=email_body,
                 )
-                db.add(alert)
-
-                # Add recovery actions
-                for i, action_text in enumerate(result.get("recovery_actions", [])):
-                    action = RecoveryAction(
-                        id=str(uuid.uuid4()),
-                        alert_id=alert.id,
-                        action_text=action_text,
-                        priority=i + 1,
-                    )
-                    db.add(action)
-
-            # Update deal health
-            deal.health_score = health_score
-            if result.get("detected_alerts"):
-                deal.status = "at_risk"
-            db.commit()
-
-            # ── WhatsApp alert for critical/high severity risks ──
-            risk_alerts = [
-                a for a in result.get("detected_alerts", [])
-                if a.get("severity") in ("critical", "high")
-            ]
-            if risk_alerts:
-                try:
-                    from app.mcp.tools.whatsapp_tools import send_deal_risk_alert
-                    for alert_data in risk_alerts:
-                        wa_result = send_deal_risk_alert(
-                            deal_title=deal.title,
-                            client_name=deal.client_name or "Unknown",
-                            alert_type=alert_data.get("alert_type", "sentiment_drop"),
-                            severity=alert_data.get("severity", "high"),
-                            health_score=health_score,
-                            sentiment_score=result.get("overall_sentiment", 0.0),
-                            description=alert_data.get("description", ""),
-                        )
-                        if wa_result.get("status") == "ok":
-                            logger.info(f"run_monitoring_flow: WhatsApp alert sent — SID: {wa_result.get('message_sid')}")
-                        else:
-                            logger.warning(f"run_monitoring_flow: WhatsApp alert failed — {wa_result.get('error')}")
-                except Exception as wa_err:
-                    logger.warning(f"run_monitoring_flow: WhatsApp notification skipped — {wa_err}")
-
-            await send_update(task_id, "complete", 4, 4, "completed", "Monitoring complete", {
-                "health_score": health_score,
-                "sentiment": result.get("overall_sentiment"),
-                "alerts_generated": alerts_count,
-                "whatsapp_notified": len(risk_alerts) > 0,
-            })
-    except Exception as e:
-        logger.error(f"run_monitoring_flow: exception occurred - {type(e).__name__}: {e}")
-        db.rollback()
-        await send_update(task_id, "error", 0, 4, "failed", f"Error: {str(e)}")
-    finally:
-        db.close()
+                for alert_data in risk_alerts
+            ), return_exceptions=True)
+            for wa_result in wa_results:
+                if isinstance(wa_result, Exception):
+                    logger.warning(f"run_monitoring_flow: WhatsApp notification skipped — {wa_result}")
+                elif wa_result.get("status") == "ok":
+                    logger.info(f"run_monitoring_flow: WhatsApp alert sent — SID: {wa_result.get('message_sid')}")
+                else:
+                    logger.warning(f"run_monitoring_flow: WhatsApp alert failed — {wa_result.get('error')}")
+
+        await send_update(task_id, "complete", 4, 4, "completed", "Monitoring complete", {
+            "health_score": health_score,
+            "sentiment": result.get("overall_sentiment"),
+            "alerts_generated": alerts_count,
+            "whatsapp_notified": len(risk_alerts) > 0,
+        })
+
+    await _run_flow(
+        "monitoring", monitoring_graph, deal_id, task_id,
+        MONITORING_STEPS, MONITORING_STEP_MESSAGES,
+        build_state, persist_result,
+    )
 
 
 async def run_agent_flow(task_id: str, deal_id: str, flow_type: str, **kwargs):
@@ -0,0 +1,20 @@
+"""Progress reporting from inside graph nodes.
+
+The orchestrator passes a ``report_progress(step, message, data=None)`` callable in the
+graph config; nodes look it up here so they can push partial results (e.g. streamed
+proposal sections) over the task WebSocket. It is safe to call from worker threads.
+"""
+from typing import Any, Callable, Dict, Optional
+
+REPORT_PROGRESS_KEY = "report_progress"
+
+ProgressReporter = Callable[..., None]
+
+
+def _noop(step: str, message: str, data: Optional[Dict[str, Any]] = None) -> None:
+    pass
+
+
+def get_progress_reporter(config: Optional[Dict[str, Any]]) -> ProgressReporter:
+    """Reporter from a node's RunnableConfig, or a no-op when run outside the orchestrator."""
+    return ((config or {}).get("configurable") or {}).get(REPORT_PROGRESS_KEY) or _noop
@@ -1,14 +1,67 @@
 import json
+import hashlib
 import logging
-from typing import Dict, Any
+import re
+import textwrap
+import orjson
+from collections import OrderedDict
+from functools import cache, lru_cache
+from typing import Dict, Any, Tuple
 from langgraph.graph import StateGraph, END
 from app.agents.state import QualificationState
-from app.services.llm import call_llm
+from app.agents.progress import ProgressReporter, get_progress_reporter
+from app.services.llm import acall_llm, acall_llm_stream, extract_json_object
+from app.config import settings
 from app.websocket.manager import ws_manager
 import asyncio
 
+try:
+    import tiktoken
+except ImportError:  # optional — documents are cut by an estimated character budget instead
+    tiktoken = None
+
 logger = logging.getLogger(__name__)
 
+# JSON field specs shared by the separate extract/analyze prompts and the fused one
+_EXTRACTION_FIELDS = """    "requirements": [
+        {
+            "category": "technical|functional|integration|infrastructure|security|compliance",
+            "text": "The specific requirement",
+            "priority": "must_have|should_have|nice_to_have",
+            "confidence": 0.0 to 1.0
+        }
+    ],
+    "entities": {
+        "client_name": "...",
+        "project_name": "...",
+        "budget_range": "...",
+        "timeline": "...",
+        "deadline": "...",
+        "key_stakeholders": ["..."],
+        "industry": "...",
+        "technologies_mentioned": ["..."]
+    }"""
+
+_GAP_ANALYSIS_FIELDS = """    "capability_match_percent": 0-100,
+    "strong_areas": ["specific areas where our company profile and/or team skills demonstrably match requirements"],
+    "gap_areas": ["specific requirement areas where neither our company services nor team skills provide coverage"],
+    "risk_factors": ["concrete risks based on real gaps, timeline constraints, budget concerns, or capacity limits"],
+    "opportunity_factors": ["positive signals — e.g. industry experience, relevant products, matching tech stack, global client experience"],
+    "resource_estimate": {
+        "team_size": "estimated team size needed",
+        "duration": "estimated duration",
+        "key_roles": ["specific roles needed, noting which we have and which we'd need to hire/contract"]
+    }"""
+
+_CAPABILITY_GUIDANCE = (
+    "IMPORTANT: Base your analysis on BOTH our company profile (services, technologies, industries, products, awards) "
+    "AND our actual employee skills listed above. A capability is CONFIRMED if it appears in our services, technology "
+    "stack, OR employee skills. Flag gaps only for requirements that genuinely don't match anything in our profile or team."
+)
+
+# Rough characters-per-token ratio used when tiktoken isn't available
+CHARS_PER_TOKEN = 4
+
 
 async def notify_step(task_id: str, step: str, step_number: int, total: int, status: str = "processing", message: str = "", data: dict = None):
     """Send WebSocket notification about agent progress."""
@@ -23,6 +76,14 @@ async def notify_step(task_id: str, step: str, step_number: int, total: int, sta
     })
 
 
+def _parse_llm_json(text: str) -> dict:
+    """First JSON object in an LLM reply, fenced or bare. Raises ValueError if there is none."""
+    result = extract_json_object(text)
+    if result is None:
+        raise ValueError("no JSON object found in LLM response")
+    return result
+
+
 def ingest_node(state: QualificationState) -> Dict[str, Any]:
     """Step 1: Parse and prepare the document for extraction."""
     logger.info("ingest node: starting document validation")
@@ -46,14 +107,168 @@ def ingest_node(state: QualificationState) -> Dict[str, Any]:
     }
 
 
-def extract_node(state: QualificationState) -> Dict[str, Any]:
+@cache
+def _token_encoding():
+    """cl100k_base encoder, or None if tiktoken (or its encoding file) is unavailable."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken encoding unavailable, truncating by characters - {e}")
+        return None
+
+
+# Start of the requirements array in a streamed extraction reply
+_REQUIREMENTS_ARRAY_RE = re.compile(r'"requirements"\s*:\s*\[')
+_json_decoder = json.JSONDecoder()
+
+
+class _RequirementStreamParser:
+    """Pulls complete ``requirements[]`` entries out of a JSON reply while it streams in.
+
+    Only the requirements array is parsed incrementally; the caller still parses the
+    full reply at the end for entities and anything after the array.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = -1      # index just inside the array once found
+        self._done = False
+        self.count = 0
+
+    def feed(self, delta: str) -> list:
+        """Add streamed text; return the requirement objects completed by it."""
+        if self._done:
+            return []
+        self._buf += delta
+        if self._pos < 0:
+            m = _REQUIREMENTS_ARRAY_RE.search(self._buf)
+            if not m:
+                return []
+            self._pos = m.end()
+
+        items = []
+        buf = self._buf
+        while True:
+            pos = self._pos
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            self._pos = pos
+            if pos >= len(buf):
+                break
+            if buf[pos] != "{":
+                self._done = True  # end of the array (or something unexpected)
+                break
+            if buf.find("}", pos) == -1:
+                break
+            try:
+                item, end = _json_decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break  # object not complete yet
+            self._pos = end
+            if isinstance(item, dict):
+                self.count += 1
+                items.append(item)
+        return items
+
+
+async def _stream_reporting_requirements(prompt: str, max_tokens: int, step: str,
+                                         report_progress: ProgressReporter,
+                                         cacheable_prefix: str | None = None) -> str:
+    """Stream an extraction reply, reporting each requirement as soon as it is complete."""
+    parser = _RequirementStreamParser()
+    parts = []
+    async for delta in acall_llm_stream(prompt, max_tokens=max_tokens, cacheable_prefix=cacheable_prefix):
+        parts.append(delta)
+        for item in parser.feed(delta):
+            report_progress(
+                step,
+                f"Extracted requirement {parser.count}: {str(item.get('text', ''))[:80]}",
+                {"partial_requirement": item},
+            )
+    return "".join(parts)
+
+
+# Parsed extraction results keyed by sha256 of the whitespace-normalized document (plus the
+# rendered profile/roster for the fused node), stored as JSON so hits hand out fresh copies.
+# Only touched from the event loop, so no lock is needed.
+_extraction_cache: "OrderedDict[str, bytes]" = OrderedDict()
+
+
+def _extraction_key(document_text: str, *context: str) -> str:
+    digest = hashlib.sha256(" ".join(document_text.split()).encode())
+    for part in context:
+        digest.update(b"\x00")
+        digest.update(part.encode())
+    return digest.hexdigest()
+
+
+def _extraction_cache_get(key: str) -> Dict[str, Any] | None:
+    cached = _extraction_cache.get(key)
+    if cached is None:
+        return None
+    _extraction_cache.move_to_end(key)
+    return orjson.loads(cached)
+
+
+def _extraction_cache_put(key: str, result: Dict[str, Any]) -> None:
+    if settings.EXTRACTION_CACHE_SIZE <= 0:
+        return
+    _extraction_cache[key] = orjson.dumps(result)
+    _extraction_cache.move_to_end(key)
+    while len(_extraction_cache) > settings.EXTRACTION_CACHE_SIZE:
+        _extraction_cache.popitem(last=False)
+
+
+def _truncate_document(text: str) -> str:
+    """Cut the document to settings.MAX_DOC_TOKENS so it fits the model's context."""
+    max_tokens = settings.MAX_DOC_TOKENS
+    if len(text) <= max_tokens:
+        return text  # every token covers at least one character
+
+    enc = _token_encoding()
+    if enc is None:
+        max_chars = max_tokens * CHARS_PER_TOKEN
+        if len(text) <= max_chars:
+            return text
+        text = text[:max_chars]
+    else:
+        tokens = enc.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        text = enc.decode(tokens[:max_tokens])
+    return text + "\n\n[Document truncated for processing]"
+
+
+def _confidence(requirement: dict) -> float:
+    try:
+        return float(requirement.get("confidence") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _top_requirements(requirements: list) -> list:
+    """At most settings.MAX_ANALYSIS_REQUIREMENTS requirements, keeping the most confident in their original order."""
+    limit = settings.MAX_ANALYSIS_REQUIREMENTS
+    if len(requirements) <= limit:
+        return requirements
+    keep = sorted(range(len(requirements)), key=lambda i: _confidence(requirements[i]), reverse=True)[:limit]
+    return [requirements[i] for i in sorted(keep)]
+
+
+async def extract_node(state: QualificationState, config=None) -> Dict[str, Any]:
     """Step 2: Extract requirements and key entities using Claude."""
     logger.info("extract node: starting requirement extraction")
     text = state["document_text"]
 
-    # Truncate if too long for context
-    if len(text) > 50000:
-        text = text[:50000] + "\n\n[Document truncated for processing]"
+    cache_key = _extraction_key(text)
+    cached = _extraction_cache_get(cache_key)
+    if cached is not None:
+        logger.info(f"extract node: reusing cached extraction - {len(cached['extracted_requirements'])} requirements")
+        return cached
+
+    text = await asyncio.to_thread(_truncate_document, text)  # tokenizing a full RFP is CPU-bound
 
     extraction_prompt = f"""Analyze this RFP/proposal document and extract structured information.
 
@@ -62,46 +277,28 @@ DOCUMENT:
 
 Extract the following as a JSON object:
 {{
-    "requirements": [
-        {{
-            "category": "technical|functional|integration|infrastructure|security|compliance",
-            "text": "The specific requirement",
-            "priority": "must_have|should_have|nice_to_have",
-            "confidence": 0.0 to 1.0
-        }}
-    ],
-    "entities": {{
-        "client_name": "...",
-        "project_name": "...",
-        "budget_range": "...",
-        "timeline": "...",
-        "deadline": "...",
-        "key_stakeholders": ["..."],
-        "industry": "...",
-        "technologies_mentioned": ["..."]
-    }}
+{_EXTRACTION_FIELDS}
 }}
 
 Be thorough - extract ALL requirements you can identify. Return ONLY valid JSON."""
 
-    result_text = call_llm(extraction_prompt, max_tokens=4096)
+    result_text = await _stream_reporting_requirements(
+        extraction_prompt, 4096, "extract", get_progress_reporter(config)
+    )
 
     try:
-        # Try to parse JSON from the response
-        if "```json" in result_text:
-            result_text = result_text.split("```json")[1].split("```")[0]
-        elif "```" in result_text:
-            result_text = result_text.split("```")[1].split("```")[0]
-
-        result = json.loads(result_text.strip())
+        result = _parse_llm_json(result_text)
         extracted_count = len(result.get("requirements", []))
         logger.info(f"extract node: successfully extracted {extracted_count} requirements")
-        return {
+        output = {
             "extracted_requirements": result.get("requirements", []),
             "extracted_entities": result.get("entities", {}),
             "current_step": "extract",
         }
-    except (json.JSONDecodeError, IndexError) as e:
+        if extracted_count:
+            _extraction_cache_put(cache_key, output)
+        return output
+    except ValueError as e:
         logger.error(f"extract node: JSON parsing failed - {str(e)}")
         return {
             "extracted_requirements": [],
@@ -111,13 +308,27 @@ Be thorough - extract ALL requirements you can identify. Return ONLY valid JSON.
         }
 
 
-def analyze_node(state: QualificationState) -> Dict[str, Any]:
-    """Step 3: Analyze requirements against company capabilities."""
-    logger.info("analyze node: starting capability analysis")
-    requirements = state.get("extracted_requirements", [])
-    entities = state.get("extracted_entities", {})
-    employees = state.get("employee_capabilities", [])
-    profile = state.get("company_profile", {})
+# Employee fields that feed the roster block — the cache key only carries these
+_ROSTER_FIELDS = ("name", "role", "department", "skills", "availability_percent")
+
+
+def _employee_aggregates(employees: list) -> Tuple[set, set, set]:
+    """(skills, roles, departments) across the roster, collected in one pass."""
+    skills, roles, departments = set(), set(), set()
+    for emp in employees:
+        skills.update(emp.get("skills") or ())
+        if emp.get("role"):
+            roles.add(emp["role"])
+        if emp.get("department"):
+            departments.add(emp["department"])
+    return skills, roles, departments
+
+
+@lru_cache(maxsize=32)
+def _render_company_block(profile_json: bytes, employees_json: bytes) -> Tuple[str, str]:
+    """(company_context, employee_summary) prompt blocks, memoized on canonical JSON of their inputs."""
+    profile = orjson.loads(profile_json)
+    employees = orjson.loads(employees_json)
 
     # ── Build company profile context from esshva_company_profile.json ──
     company_info = profile.get("company", {})
@@ -129,21 +340,30 @@ def analyze_node(state: QualificationState) -> Dict[str, Any]:
     awards = profile.get("awards_and_recognition", [])
     global_reach = profile.get("global_reach", {})
 
+    primary_services = services.get("primary", [])
+    services_text = "\n".join(
+        [f"- {s.get('name', '')}: {s.get('description', '')}" for s in primary_services]
+    ) if primary_services else "Not specified"
+    products_text = ", ".join(
+        [f"{p.get('name', '')} ({p.get('description', '')[:60]})" for p in products[:4]]
+    ) if products else "Not specified"
+    awards_text = ", ".join([a.get("award", "") for a in awards]) if awards else "None"
+
     company_context = f"""COMPANY: {company_info.get('brand_name', 'ESSHVA')} ({company_info.get('legal_name', 'ESSHVA TECHQ PVT LTD')})
 FOUNDED: {company_info.get('founded', 'N/A')} | HQ: {company_info.get('headquarters', {}).get('city', 'Colombo')}, {company_info.get('headquarters', {}).get('country', 'Sri Lanka')}
 CERTIFICATIONS: {', '.join(company_info.get('certifications', [])) or 'None listed'}
 EMPLOYEE COUNT: {company_info.get('employee_count', len(employees))}
 
 SERVICES OFFERED:
-{chr(10).join('- ' + s.get('name', '') + ': ' + s.get('description', '') for s in services.get('primary', [])) if services.get('primary') else 'Not specified'}
+{services_text}
 
 KNOWN TECHNOLOGIES: {', '.join(tech.get('known_stack', [])) or 'Not specified'}
 
 INDUSTRIES SERVED: {', '.join(industries) or 'Not specified'}
 
-PRODUCTS BUILT: {', '.join(p.get('name', '') + ' (' + p.get('description', '')[:60] + ')' for p in products[:4]) if products else 'Not specified'}
+PRODUCTS BUILT: {products_text}
 
-AWARDS: {', '.join(a.get('award', '') for a in awards) if awards else 'None'}
+AWARDS: {awards_text}
 
 GLOBAL CLIENTS: {', '.join(global_reach.get('client_regions', [])) or 'Not specified'}
 NOTABLE CLIENTS: {global_reach.get('notable_client_types', 'Not specified')}
@@ -158,15 +378,16 @@ CAPABILITY AREAS:
 - Digital Transformation: {capabilities.get('digital_transformation', 'N/A')}"""
 
     # ── Build employee roster summary ──
-    all_skills = set()
-    all_roles = set()
-    all_departments = set()
-    for emp in employees:
-        all_skills.update(s for s in (emp.get("skills") or []))
-        if emp.get("role"):
-            all_roles.add(emp["role"])
-        if emp.get("department"):
-            all_departments.add(emp["department"])
+    all_skills, all_roles, all_departments = _employee_aggregates(employees)
+
+    roster_lines = [
+        f"- {emp.get('name', 'Unknown')} | {emp.get('role', '')} | "
+        f"Skills: {', '.join(emp.get('skills', [])[:8])} | "
+        f"Availability: {emp.get('availability_percent', 100)}%"
+        for emp in employees[:20]
+    ]
+    if len(employees) > 20:
+        roster_lines.append(f"... and {len(employees) - 20} more employees")
 
     employee_summary = f"""
 CURRENT TEAM ({len(employees)} active employees):
@@ -175,18 +396,69 @@ ROLES ON STAFF: {', '.join(sorted(all_roles)) if all_roles else 'Not specified'}
 ALL SKILLS AVAILABLE: {', '.join(sorted(all_skills)) if all_skills else 'Not specified'}
 
 EMPLOYEE ROSTER:"""
-    for emp in employees[:20]:
-        skills_str = ', '.join(emp.get('skills', [])[:8])
-        employee_summary += f"\n- {emp.get('name', 'Unknown')} | {emp.get('role', '')} | Skills: {skills_str} | Availability: {emp.get('availability_percent', 100)}%"
-    if len(employees) > 20:
-        employee_summary += f"\n... and {len(employees) - 20} more employees"
+    if roster_lines:
+        employee_summary += "\n" + "\n".join(roster_lines)
 
-    analysis_prompt = f"""You are Quinn, an AI deal intelligence agent for ESSHVA. Analyze these extracted requirements against our ACTUAL company profile and team capabilities to assess deal viability.
+    return company_context, employee_summary
 
-CLIENT: {entities.get('client_name', 'Unknown')}
-INDUSTRY: {entities.get('industry', 'Unknown')}
-BUDGET: {entities.get('budget_range', 'Unknown')}
-TIMELINE: {entities.get('timeline', 'Unknown')}
+
+def _profile_key(profile: dict) -> bytes:
+    """Canonical (sorted-key) JSON of the company profile, the cache key for its renders."""
+    return orjson.dumps(profile, option=orjson.OPT_SORT_KEYS)
+
+
+@lru_cache(maxsize=32)
+def _render_company_strengths(profile_json: bytes) -> str:
+    """Short company-strengths block for the decision prompt, memoized per profile."""
+    profile = orjson.loads(profile_json)
+    services_list = [s.get("name", "") for s in profile.get("services", {}).get("primary", [])]
+    tech_stack = profile.get("technologies", {}).get("known_stack", [])
+    industries = profile.get("industries_served", [])
+    awards_list = [a.get("award", "") for a in profile.get("awards_and_recognition", [])]
+    client_regions = profile.get("global_reach", {}).get("client_regions", [])
+    certifications = profile.get("company", {}).get("certifications", [])
+    return f"""
+ESSHVA COMPANY STRENGTHS:
+- Services: {', '.join(services_list) if services_list else 'N/A'}
+- Tech Stack: {', '.join(tech_stack) if tech_stack else 'N/A'}
+- Industries Served: {', '.join(industries) if industries else 'N/A'}
+- Global Presence: Clients in {', '.join(client_regions) if client_regions else 'N/A'}
+- Awards: {', '.join(awards_list) if awards_list else 'None'}
+- Certifications: {', '.join(certifications) if certifications else 'None'}"""
+
+
+def _company_blocks(profile: dict, employees: list) -> Tuple[str, str]:
+    """Rendered (company_context, employee_summary) for the state's profile and roster."""
+    return _render_company_block(
+        _profile_key(profile),
+        orjson.dumps([
+            {k: emp[k] for k in _ROSTER_FIELDS if k in emp}
+            for emp in employees
+        ]),
+    )
+
+
+async def extract_and_analyze_node(state: QualificationState, config=None) -> Dict[str, Any]:
+    """Steps 2+3 in one LLM call: extract requirements/entities and analyze them against our capabilities.
+
+    Used instead of extract_node + analyze_node when QUALIFICATION_FUSED_EXTRACT is set.
+    """
+    logger.info("extract_and_analyze node: starting fused extraction and capability analysis")
+    company_context, employee_summary = _company_blocks(
+        state.get("company_profile", {}), state.get("employee_capabilities", [])
+    )
+
+    # The gap analysis depends on the profile and roster too, so they are part of the key
+    cache_key = _extraction_key(state["document_text"], company_context, employee_summary)
+    cached = _extraction_cache_get(cache_key)
+    if cached is not None:
+        logger.info(f"extract_and_analyze node: reusing cached result - {len(cached['extracted_requirements'])} requirements")
+        return cached
+
+    text = await asyncio.to_thread(_truncate_document, state["document_text"])  # tokenizing a full RFP is CPU-bound
+
+    # Profile + team + instructions are the cacheable prefix; the document is the tail
+    prefix = f"""You are Quinn, an AI deal intelligence agent for ESSHVA. Read the RFP/proposal document below, extract its requirements and key entities, then analyze them against our ACTUAL company profile and team capabilities to assess deal viability.
 
 ═══ ESSHVA COMPANY PROFILE ═══
 {company_context}
@@ -194,43 +466,104 @@ TIMELINE: {entities.get('timeline', 'Unknown')}
 ═══ ESSHVA TEAM CAPABILITIES ═══
 {employee_summary}
 
-═══ CLIENT REQUIREMENTS ({len(requirements)} total) ═══
-{json.dumps(requirements, indent=2)}
+{_CAPABILITY_GUIDANCE}
+
+Return a single JSON object:
+{{
+{_EXTRACTION_FIELDS},
+    "gap_analysis": {{
+{textwrap.indent(_GAP_ANALYSIS_FIELDS, "    ")}
+    }}
+}}
+"""
+
+    prompt = f"""
+DOCUMENT:
+{text}
+
+Be thorough - extract ALL requirements you can identify. Return ONLY valid JSON."""
+
+    result_text = await _stream_reporting_requirements(
+        prompt, 6144, "extract_and_analyze", get_progress_reporter(config), cacheable_prefix=prefix
+    )
+
+    try:
+        result = _parse_llm_json(result_text)
+        requirements = result.get("requirements", [])
+        gap_analysis = result.get("gap_analysis", {})
+        logger.info(
+            f"extract_and_analyze node: extracted {len(requirements)} requirements - "
+            f"capability_match_percent={gap_analysis.get('capability_match_percent', 0)}"
+        )
+        output = {
+            "extracted_requirements": requirements,
+            "extracted_entities": result.get("entities", {}),
+            "gap_analysis": gap_analysis,
+            "current_step": "extract_and_analyze",
+        }
+        if requirements:
+            _extraction_cache_put(cache_key, output)
+        return output
+    except ValueError as e:
+        logger.error(f"extract_and_analyze node: JSON parsing failed - {str(e)}")
+        return {
+            "extracted_requirements": [],
+            "extracted_entities": {},
+            "gap_analysis": {},
+            "errors": [f"Extraction parsing error: {str(e)}"],
+            "current_step": "extract_and_analyze",
+        }
+
+
+async def analyze_node(state: QualificationState) -> Dict[str, Any]:
+    """Step 3: Analyze requirements against company capabilities."""
+    logger.info("analyze node: starting capability analysis")
+    requirements = state.get("extracted_requirements", [])
+    entities = state.get("extracted_entities", {})
+    employees = state.get("employee_capabilities", [])
+    profile = state.get("company_profile", {})
 
-IMPORTANT: Base your analysis on BOTH our company profile (services, technologies, industries, products, awards) AND our actual employee skills listed above. A capability is CONFIRMED if it appears in our services, technology stack, OR employee skills. Flag gaps only for requirements that genuinely don't match anything in our profile or team.
+    company_context, employee_summary = _company_blocks(profile, employees)
+
+    # Static profile + team + instructions first (cacheable prefix); deal-specific data last
+    analysis_prefix = f"""You are Quinn, an AI deal intelligence agent for ESSHVA. Analyze the client requirements below against our ACTUAL company profile and team capabilities to assess deal viability.
+
+═══ ESSHVA COMPANY PROFILE ═══
+{company_context}
+
+═══ ESSHVA TEAM CAPABILITIES ═══
+{employee_summary}
+
+{_CAPABILITY_GUIDANCE}
 
 Provide your gap analysis as JSON:
 {{
-    "capability_match_percent": 0-100,
-    "strong_areas": ["specific areas where our company profile and/or team skills demonstrably match requirements"],
-    "gap_areas": ["specific requirement areas where neither our company services nor team skills provide coverage"],
-    "risk_factors": ["concrete risks based on real gaps, timeline constraints, budget concerns, or capacity limits"],
-    "opportunity_factors": ["positive signals — e.g. industry experience, relevant products, matching tech stack, global client experience"],
-    "resource_estimate": {{
-        "team_size": "estimated team size needed",
-        "duration": "estimated duration",
-        "key_roles": ["specific roles needed, noting which we have and which we'd need to hire/contract"]
-    }}
+{_GAP_ANALYSIS_FIELDS}
 }}
+"""
+
+    analysis_prompt = f"""
+CLIENT: {entities.get('client_name', 'Unknown')}
+INDUSTRY: {entities.get('industry', 'Unknown')}
+BUDGET: {entities.get('budget_range', 'Unknown')}
+TIMELINE: {entities.get('timeline', 'Unknown')}
+
+═══ CLIENT REQUIREMENTS ({len(requirements)} total) ═══
+{json.dumps(_top_requirements(requirements), indent=2)}
 
 Return ONLY valid JSON."""
 
-    result_text = call_llm(analysis_prompt, max_tokens=2048)
+    result_text = await acall_llm(analysis_prompt, max_tokens=2048, cacheable_prefix=analysis_prefix)
 
     try:
-        if "```json" in result_text:
-            result_text = result_text.split("```json")[1].split("```")[0]
-        elif "```" in result_text:
-            result_text = result_text.split("```")[1].split("```")[0]
-
-        gap_analysis = json.loads(result_text.strip())
+        gap_analysis = _parse_llm_json(result_text)
         capability_match = gap_analysis.get("capability_match_percent", 0)
         logger.info(f"analyze node: gap analysis complete - capability_match_percent={capability_match}")
         return {
             "gap_analysis": gap_analysis,
             "current_step": "analyze",
         }
-    except (json.JSONDecodeError, IndexError) as e:
+    except ValueError as e:
         logger.error(f"analyze node: JSON parsing failed - {str(e)}")
         return {
             "gap_analysis": {},
@@ -239,7 +572,10 @@ Return ONLY valid JSON."""
 
 
 def match_node(state: QualificationState) -> Dict[str, Any]:
-    """Step 4: Match requirements against employee skills database."""
+    """Step 4: Match requirements against employee skills database.
+
+    Runs in parallel with decide_node, so it leaves current_step to that branch.
+    """
     logger.info("match node: starting employee skill matching")
     # This node queries the employee database to find skill matches
     # In a real implementation, it would use the DB session
@@ -252,11 +588,10 @@ def match_node(state: QualificationState) -> Dict[str, Any]:
 
     return {
         "skill_matches": skill_matches,
-        "current_step": "match",
     }
 
 
-def decide_node(state: QualificationState) -> Dict[str, Any]:
+async def decide_node(state: QualificationState) -> Dict[str, Any]:
     """Step 5: Make GO/NO-GO/CONDITIONAL-GO recommendation."""
     logger.info("decide node: generating deal recommendation")
     requirements = state.get("extracted_requirements", [])
@@ -268,45 +603,18 @@ def decide_node(state: QualificationState) -> Dict[str, Any]:
     team_size = len(employees)
     team_summary = f"{team_size} employees on staff"
     if employees:
-        all_skills = set()
-        for emp in employees:
-            all_skills.update(emp.get("skills", []))
+        all_skills, _, _ = _employee_aggregates(employees)
         team_summary += f" with {len(all_skills)} unique skills across the team"
 
-    # Build concise company strengths from profile
-    company_strengths = ""
-    if profile:
-        services_list = [s.get("name", "") for s in profile.get("services", {}).get("primary", [])]
-        tech_stack = profile.get("technologies", {}).get("known_stack", [])
-        industries = profile.get("industries_served", [])
-        awards_list = [a.get("award", "") for a in profile.get("awards_and_recognition", [])]
-        client_regions = profile.get("global_reach", {}).get("client_regions", [])
-        certifications = profile.get("company", {}).get("certifications", [])
-        company_strengths = f"""
-ESSHVA COMPANY STRENGTHS:
-- Services: {', '.join(services_list) if services_list else 'N/A'}
-- Tech Stack: {', '.join(tech_stack) if tech_stack else 'N/A'}
-- Industries Served: {', '.join(industries) if industries else 'N/A'}
-- Global Presence: Clients in {', '.join(client_regions) if client_regions else 'N/A'}
-- Awards: {', '.join(awards_list) if awards_list else 'None'}
-- Certifications: {', '.join(certifications) if certifications else 'None'}"""
+    # Concise company strengths from profile
+    company_strengths = _render_company_strengths(_profile_key(profile)) if profile else ""
 
-    decision_prompt = f"""You are Quinn, an AI deal intelligence agent for ESSHVA. Based on the complete analysis against our actual company profile and team capabilities, make a deal qualification decision.
+    # Team + company strengths + instructions are the cacheable prefix; the analysis follows
+    decision_prefix = f"""You are Quinn, an AI deal intelligence agent for ESSHVA. Based on the complete analysis below against our actual company profile and team capabilities, make a deal qualification decision.
 
-CLIENT: {entities.get('client_name', 'Unknown')}
-BUDGET: {entities.get('budget_range', 'Unknown')}
-TIMELINE: {entities.get('timeline', 'Unknown')}
 OUR TEAM: {team_summary}
 {company_strengths}
 
-CAPABILITY MATCH: {gap_analysis.get('capability_match_percent', 'Unknown')}%
-STRONG AREAS: {json.dumps(gap_analysis.get('strong_areas', []))}
-GAP AREAS: {json.dumps(gap_analysis.get('gap_areas', []))}
-RISK FACTORS: {json.dumps(gap_analysis.get('risk_factors', []))}
-OPPORTUNITY FACTORS: {json.dumps(gap_analysis.get('opportunity_factors', []))}
-RESOURCE ESTIMATE: {json.dumps(gap_analysis.get('resource_estimate', {}))}
-TOTAL REQUIREMENTS: {len(requirements)}
-
 Make your decision as JSON. Be specific — reference actual company capabilities, service offerings, industry experience, team skills, and any gaps:
 {{
     "recommendation": "go|no_go|conditional_go",
@@ -316,18 +624,27 @@ Make your decision as JSON. Be specific — reference actual company capabilitie
     "conditions": ["conditions that must be met for GO, if conditional — e.g. hiring, upskilling, partnering, technology acquisition"],
     "reasoning": "2-3 sentence explanation grounded in our actual company profile and capability match"
 }}
+"""
+
+    decision_prompt = f"""
+CLIENT: {entities.get('client_name', 'Unknown')}
+BUDGET: {entities.get('budget_range', 'Unknown')}
+TIMELINE: {entities.get('timeline', 'Unknown')}
+
+CAPABILITY MATCH: {gap_analysis.get('capability_match_percent', 'Unknown')}%
+STRONG AREAS: {json.dumps(gap_analysis.get('strong_areas', []))}
+GAP AREAS: {json.dumps(gap_analysis.get('gap_areas', []))}
+RISK FACTORS: {json.dumps(gap_analysis.get('risk_factors', []))}
+OPPORTUNITY FACTORS: {json.dumps(gap_analysis.get('opportunity_factors', []))}
+RESOURCE ESTIMATE: {json.dumps(gap_analysis.get('resource_estimate', {}))}
+TOTAL REQUIREMENTS: {len(requirements)}
 
 Return ONLY valid JSON."""
 
-    result_text = call_llm(decision_prompt, max_tokens=1024)
+    result_text = await acall_llm(decision_prompt, max_tokens=1024, cacheable_prefix=decision_prefix)
 
     try:
-        if "```json" in result_text:
-            result_text = result_text.split("```json")[1].split("```")[0]
-        elif "```" in result_text:
-            result_text = result_text.split("```")[1].split("```")[0]
-
-        decision = json.loads(result_text.strip())
+        decision = _parse_llm_json(result_text)
         recommendation = decision.get("recommendation", "no_go")
         confidence_score = decision.get("confidence_score", 0.5)
         logger.info(f"decide node: decision generated - recommendation={recommendation}, confidence_score={confidence_score}")
@@ -340,7 +657,7 @@ Return ONLY valid JSON."""
             "reasoning": decision.get("reasoning", ""),
             "current_step": "decide",
         }
-    except (json.JSONDecodeError, IndexError) as e:
+    except ValueError as e:
         logger.error(f"decide node: decision generation failed - {str(e)}")
         return {
             "recommendation": "no_go",
@@ -351,20 +668,32 @@ Return ONLY valid JSON."""
 
 
 def build_qualification_graph() -> StateGraph:
-    """Build the qualification LangGraph workflow."""
+    """Build the qualification LangGraph workflow.
+
+    The LLM nodes are coroutines, so the graph must be driven with ainvoke/astream.
+    """
     workflow = StateGraph(QualificationState)
 
     workflow.add_node("ingest", ingest_node)
-    workflow.add_node("extract", extract_node)
-    workflow.add_node("analyze", analyze_node)
     workflow.add_node("match", match_node)
     workflow.add_node("decide", decide_node)
-
     workflow.set_entry_point("ingest")
-    workflow.add_edge("ingest", "extract")
-    workflow.add_edge("extract", "analyze")
-    workflow.add_edge("analyze", "match")
-    workflow.add_edge("match", "decide")
+
+    if settings.QUALIFICATION_FUSED_EXTRACT:
+        workflow.add_node("extract_and_analyze", extract_and_analyze_node)
+        workflow.add_edge("ingest", "extract_and_analyze")
+        analysis_step = "extract_and_analyze"
+    else:
+        workflow.add_node("extract", extract_node)
+        workflow.add_node("analyze", analyze_node)
+        workflow.add_edge("ingest", "extract")
+        workflow.add_edge("extract", "analyze")
+        analysis_step = "analyze"
+
+    # match and decide both need only the gap analysis — fan out instead of chaining them
+    workflow.add_edge(analysis_step, "match")
+    workflow.add_edge(analysis_step, "decide")
+    workflow.add_edge("match", END)
     workflow.add_edge("decide", END)
 
     return workflow.compile()
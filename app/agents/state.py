@@ -1,3 +1,10 @@
+"""LangGraph state schemas for the agent flows.
+
+The graphs are compiled without a checkpointer, so state is never serialized
+between nodes — LangGraph merges plain dicts in memory. That makes TypedDict the
+cheapest representation; a serializing struct type would only pay off once a
+persistent checkpointer is added.
+"""
 from typing import TypedDict, List, Dict, Any, Optional, Annotated
 from langgraph.graph import add_messages
 
@@ -43,6 +50,8 @@ class ProposalState(TypedDict):
     company_profile: Dict[str, Any]
     # RAG context
     retrieved_sections: List[Dict[str, Any]]
+    # Prompt blocks built alongside retrieval (team, company, strategy, requirements)
+    prompt_parts: Dict[str, Any]
     # Generation
     proposal_draft: str
     proposal_sections: List[Dict[str, Any]]
@@ -66,6 +75,7 @@ class MonitoringState(TypedDict):
     deal_data: Dict[str, Any]
     recent_communications: List[Dict[str, Any]]
     # Analysis
+    keyword_hits: List[str]  # competitor terms found in raw communications
     sentiment_scores: List[Dict[str, Any]]
     overall_sentiment: float
     health_score: int
@@ -0,0 +1,62 @@
+"""Bounded in-process store for agent task progress.
+
+Entries expire TASK_STORE_TTL_SECONDS after their last update and the store
+never holds more than TASK_STORE_MAX_TASKS tasks (least-recently-updated
+are evicted first). It is per-process, so with several uvicorn workers a
+status poll must hit the worker that runs the task.
+"""
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, Tuple
+
+
+class TaskStore(MutableMapping):
+    """Thread-safe dict of task_id → latest update, with TTL and a size cap."""
+
+    def __init__(self, ttl_seconds: float, max_tasks: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_tasks = max_tasks
+        self._data: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, written_at: float, now: float) -> bool:
+        return now - written_at > self.ttl_seconds
+
+    def _evict(self, now: float) -> None:
+        # Oldest writes sit at the front — stop at the first live entry
+        while self._data:
+            _, (written_at, _) = next(iter(self._data.items()))
+            if len(self._data) <= self.max_tasks and not self._expired(written_at, now):
+                break
+            self._data.popitem(last=False)
+
+    def __setitem__(self, task_id: str, update: Dict[str, Any]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._data[task_id] = (now, update)
+            self._data.move_to_end(task_id)
+            self._evict(now)
+
+    def __getitem__(self, task_id: str) -> Dict[str, Any]:
+        with self._lock:
+            written_at, update = self._data[task_id]
+            if self._expired(written_at, time.monotonic()):
+                del self._data[task_id]
+                raise KeyError(task_id)
+            return update
+
+    def __delitem__(self, task_id: str) -> None:
+        with self._lock:
+            del self._data[task_id]
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            self._evict(time.monotonic())
+            return iter(list(self._data))
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._evict(time.monotonic())
+            return len(self._data)
@@ -1,6 +1,7 @@
 import logging
 from sqlalchemy import create_engine, event, text, inspect
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.pool import QueuePool
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -23,8 +24,9 @@ else:
     engine = create_engine(
         settings.DATABASE_URL,
         pool_pre_ping=True,
-        pool_size=10,
-        max_overflow=20,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_recycle=settings.DB_POOL_RECYCLE,
     )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -43,10 +45,52 @@ def get_db():
         db.close()
 
 
+def pool_status() -> dict:
+    """Connection pool occupancy for the health endpoint.
+
+    checked_out close to size + max_overflow means requests and agent flows are
+    queueing for connections (raise DB_POOL_SIZE / DB_MAX_OVERFLOW).
+    """
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"class": type(pool).__name__}
+    return {
+        "class": type(pool).__name__,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "max_overflow": pool._max_overflow,
+    }
+
+
+def _existing_columns(conn, tables: list[str]) -> set[tuple[str, str]]:
+    """(table, column) pairs present in the database for the given tables.
+
+    PostgreSQL answers in one information_schema query; other backends go through
+    the inspector once per distinct table.
+    """
+    if conn.dialect.name == "postgresql":
+        rows = conn.execute(
+            text(
+                "SELECT table_name, column_name FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND table_name = ANY(:tables)"
+            ),
+            {"tables": list(tables)},
+        )
+        return {(t, c) for t, c in rows}
+
+    insp = inspect(conn)
+    existing_tables = set(insp.get_table_names())
+    return {
+        (table, col["name"])
+        for table in set(tables) & existing_tables
+        for col in insp.get_columns(table)
+    }
+
+
 def _auto_migrate(engine_instance):
     """Add missing columns to existing tables (lightweight SQLite migration)."""
-    insp = inspect(engine_instance)
-
     # Define migrations as (table, column, sql_type_default)
     migrations = [
         ("alerts", "email_subject", "VARCHAR(500)"),
@@ -54,18 +98,103 @@ def _auto_migrate(engine_instance):
     ]
 
     with engine_instance.connect() as conn:
+        tables = [table for table, _, _ in migrations]
+        have = _existing_columns(conn, tables)
+        existing_tables = {table for table, _ in have}
         for table, column, col_type in migrations:
-            if table in insp.get_table_names():
-                existing_cols = [c["name"] for c in insp.get_columns(table)]
-                if column not in existing_cols:
-                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}"))
-                    logger.info("Auto-migrate: added column %s.%s (%s)", table, column, col_type)
+            if table in existing_tables and (table, column) not in have:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}"))
+                logger.info("Auto-migrate: added column %s.%s (%s)", table, column, col_type)
         conn.commit()
 
 
+# Columns searched by SQLAdmin (ILIKE '%term%') — only a trigram GIN index can serve those
+TRIGRAM_INDEXES = [
+    ("users", "email"),
+    ("users", "full_name"),
+    ("deals", "title"),
+    ("deals", "client_name"),
+    ("documents", "filename"),
+    ("alerts", "title"),
+    ("proposals", "title"),
+    ("employees", "name"),
+    ("employees", "role"),
+    ("employees", "department"),
+]
+
+
+# Admin list pages sort newest-first and paginate — (name, table, columns)
+SORT_INDEXES = [
+    ("idx_users_created_at_desc", "users", "created_at DESC"),
+    ("idx_deals_created_at_desc", "deals", "created_at DESC"),
+    ("idx_deals_stage_created_at_desc", "deals", "stage, created_at DESC"),
+    ("idx_documents_created_at_desc", "documents", "created_at DESC"),
+    ("idx_alerts_created_at_desc", "alerts", "created_at DESC"),
+    ("idx_proposals_created_at_desc", "proposals", "created_at DESC"),
+    ("idx_deal_analysis_created_at_desc", "deal_analysis", "created_at DESC"),
+]
+
+
+def _drop_invalid_indexes(conn, names: list[str]):
+    """Drop INVALID leftovers of interrupted builds, which IF NOT EXISTS would otherwise skip forever."""
+    invalid = conn.execute(text(
+        "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE NOT i.indisvalid AND c.relname = ANY(:names)"
+    ), {"names": names}).scalars().all()
+    for name in invalid:
+        try:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            logger.warning("Index setup: dropped invalid index %s, rebuilding", name)
+        except Exception as e:
+            logger.warning("Index setup: could not drop invalid index %s (%s)", name, e)
+
+
+def _ensure_indexes(engine_instance):
+    """Create sort/search indexes that create_all() doesn't express.
+
+    Sort indexes are created on every backend; trigram indexes need PostgreSQL's pg_trgm.
+    Plain (non-CONCURRENTLY) builds are used: they are atomic, so a failed or cancelled
+    build at startup never leaves an INVALID index behind.
+    """
+    is_postgres = engine_instance.dialect.name == "postgresql"
+    create = "CREATE INDEX IF NOT EXISTS"
+
+    # Each statement in its own transaction, so one failure doesn't abort the rest
+    with engine_instance.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if is_postgres:
+            _drop_invalid_indexes(
+                conn,
+                [name for name, _, _ in SORT_INDEXES]
+                + [f"idx_{table}_{column}_trgm" for table, column in TRIGRAM_INDEXES],
+            )
+
+        for name, table, columns in SORT_INDEXES:
+            try:
+                conn.execute(text(f"{create} {name} ON {table} ({columns})"))
+            except Exception as e:
+                logger.warning("Index setup: could not create %s (%s)", name, e)
+
+        if not is_postgres:
+            return
+
+        try:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        except Exception as e:
+            logger.warning("Index setup: pg_trgm unavailable, skipping trigram indexes (%s)", e)
+            return
+
+        for table, column in TRIGRAM_INDEXES:
+            name = f"idx_{table}_{column}_trgm"
+            try:
+                conn.execute(text(f"{create} {name} ON {table} USING GIN ({column} gin_trgm_ops)"))
+            except Exception as e:
+                logger.warning("Index setup: could not create %s (%s)", name, e)
+
+
 def init_db():
     """Create all tables. Called on startup."""
     logger.info("Creating database tables...")
     Base.metadata.create_all(bind=engine)
     _auto_migrate(engine)
+    _ensure_indexes(engine)
     logger.info("Database tables ready.")
@@ -1,12 +1,102 @@
-from docx import Document as DocxDocument
+import posixpath
+import zipfile
+from lxml import etree
+from docx.oxml.ns import qn
+from docx.oxml.parser import parse_xml
 from pathlib import Path
 
+_W_BODY = qn("w:body")
+_W_P = qn("w:p")
+_W_TBL = qn("w:tbl")
+_W_R = qn("w:r")
+_W_HYPERLINK = qn("w:hyperlink")
+_W_PSTYLE = f"{qn('w:pPr')}/{qn('w:pStyle')}"
+_W_BR = qn("w:br")
+_W_TYPE = qn("w:type")
+_W_VAL = qn("w:val")
+
+_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"
+
+# Run children that carry text, mirroring python-docx's Run.text
+_RUN_TEXT = {
+    qn("w:t"): None,
+    qn("w:tab"): "\t",
+    qn("w:ptab"): "\t",
+    qn("w:br"): "\n",
+    qn("w:cr"): "\n",
+    qn("w:noBreakHyphen"): "-",
+}
+
+
+def _run_text(run) -> str:
+    parts = []
+    for child in run:
+        if child.tag == _W_BR and child.get(_W_TYPE, "textWrapping") != "textWrapping":
+            continue  # page/column breaks carry no text
+        if child.tag in _RUN_TEXT:
+            fixed = _RUN_TEXT[child.tag]
+            parts.append((child.text or "") if fixed is None else fixed)
+    return "".join(parts)
+
+
+def _paragraph_text(p) -> str:
+    """Text of a w:p from its direct runs and hyperlink runs (same scope as python-docx Paragraph.text)."""
+    parts = []
+    for child in p:
+        if child.tag == _W_R:
+            parts.append(_run_text(child))
+        elif child.tag == _W_HYPERLINK:
+            parts.extend(_run_text(r) for r in child if r.tag == _W_R)
+    return "".join(parts)
+
+
+def _related_part(zf: zipfile.ZipFile, source: str, rel_type: str) -> str | None:
+    """Zip name of the part ``source`` points to with a ``rel_type`` relationship.
+
+    ``source`` is a part name, or "" for the package itself. ``rel_type`` is matched on
+    its last path segment (e.g. "officeDocument"), which covers both the transitional and
+    strict relationship URIs. Returns None if there is no such internal relationship.
+    """
+    base_dir, base_name = posixpath.split(source)
+    try:
+        root = etree.fromstring(zf.read(posixpath.join(base_dir, "_rels", f"{base_name}.rels")))
+    except KeyError:
+        return None
+    for rel in root.iterfind(_PKG_REL):
+        if rel.get("TargetMode") == "External" or rel.get("Type", "").rsplit("/", 1)[-1] != rel_type:
+            continue
+        target = rel.get("Target", "")
+        if target.startswith("/"):
+            return target[1:]
+        return posixpath.normpath(posixpath.join(base_dir, target))
+    return None
+
+
+def _style_names(zf: zipfile.ZipFile, document_part: str) -> dict:
+    """styleId -> UI style name ("heading 1" is shown as "Heading 1", like python-docx)."""
+    styles_part = _related_part(zf, document_part, "styles")
+    if styles_part is None:
+        return {}
+    try:
+        root = etree.fromstring(zf.read(styles_part))
+    except KeyError:
+        return {}
+    names = {}
+    for style in root.iterfind(qn("w:style")):
+        name_el = style.find(qn("w:name"))
+        if name_el is None:
+            continue
+        name = name_el.get(_W_VAL, "")
+        if name.startswith("heading "):
+            name = "H" + name[1:]
+        names[style.get(qn("w:styleId"))] = name
+    return names
+
 
 class DocxExtractor:
     """Extract text and structure from Word documents."""
 
     def extract(self, file_path: str) -> dict:
-        doc = DocxDocument(file_path)
         result = {
             "text": "",
             "sections": [],
@@ -15,28 +105,51 @@ class DocxExtractor:
             "metadata": {},
         }
 
-        text_parts = []
-        for para in doc.paragraphs:
-            text_parts.append(para.text)
-            if para.style and para.style.name and para.style.name.startswith("Heading"):
-                result["sections"].append({
-                    "title": para.text.strip(),
-                    "style": para.style.name,
-                })
-
-        result["text"] = "\n".join(text_parts)
-
-        # Extract tables
-        for table in doc.tables:
-            result["tables_found"] += 1
-
-        # Core properties
-        if doc.core_properties:
-            result["metadata"] = {
-                "author": doc.core_properties.author or "",
-                "title": doc.core_properties.title or "",
-                "created": str(doc.core_properties.created) if doc.core_properties.created else "",
-            }
+        with zipfile.ZipFile(file_path) as zf:
+            # Part names come from the package relationships, as python-docx resolves them
+            # (some generators write e.g. word/document2.xml)
+            document_part = _related_part(zf, "", "officeDocument")
+            if document_part is None:
+                raise ValueError(f"{Path(file_path).name} has no main document part")
+            style_names = _style_names(zf, document_part)
+
+            # One streaming pass over the body: top-level paragraphs and tables only
+            text_parts = []
+            with zf.open(document_part) as xml:
+                for _, elem in etree.iterparse(xml, events=("end",), tag=(_W_P, _W_TBL)):
+                    parent = elem.getparent()
+                    if parent is None or parent.tag != _W_BODY:
+                        continue  # paragraphs inside tables are cleared with their table
+                    if elem.tag == _W_TBL:
+                        result["tables_found"] += 1
+                    else:
+                        text = _paragraph_text(elem)
+                        text_parts.append(text)
+                        style_el = elem.find(_W_PSTYLE)
+                        style_name = style_names.get(style_el.get(_W_VAL)) if style_el is not None else None
+                        if style_name and style_name.startswith("Heading"):
+                            result["sections"].append({
+                                "title": text.strip(),
+                                "style": style_name,
+                            })
+                    elem.clear()
+                    while elem.getprevious() is not None:
+                        del parent[0]
+
+            result["text"] = "\n".join(text_parts)
+
+            # Core properties (python-docx's element class handles the W3CDTF dates)
+            core_part = _related_part(zf, "", "core-properties")
+            try:
+                core = parse_xml(zf.read(core_part)) if core_part else None
+            except KeyError:
+                core = None
+            if core is not None:
+                result["metadata"] = {
+                    "author": core.author_text or "",
+                    "title": core.title_text or "",
+                    "created": str(core.created_datetime) if core.created_datetime else "",
+                }
 
         return result
 
@@ -1,10 +1,24 @@
+import re
+import logging
 import pandas as pd
 from pathlib import Path
 from typing import Tuple
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from app.models.employee import Employee
 import uuid
 
+try:
+    import python_calamine  # noqa: F401 — Rust-backed reader, used by pandas' "calamine" engine
+    _EXCEL_ENGINE = "calamine"
+except ImportError:
+    _EXCEL_ENGINE = "openpyxl"
+
+logger = logging.getLogger(__name__)
+
+# Parenthesized units in headers, e.g. "Availability (%)" or "Rate ($)"
+_PAREN_RE = re.compile(r'\s*\([^)]*\)')
+
 
 class ExcelProcessor:
     """Process Excel files for employee data import."""
@@ -25,30 +39,51 @@ class ExcelProcessor:
             "$/hr", "hourly rate ($)", "hourly rate($)", "rate ($)", "rate($)",
         ],
     }
+    # Same names as sets for membership tests
+    _MAPPING_SETS = {field: frozenset(names) for field, names in COLUMN_MAPPINGS.items()}
 
     @staticmethod
     def _normalize(text: str) -> str:
         """Normalize a column header: lowercase, strip, remove parenthesized units."""
-        import re
         text = text.lower().strip()
         # Remove parenthesized content like "(%)" or "($)" for fuzzy matching
-        text_stripped = re.sub(r'\s*\([^)]*\)', '', text).strip()
+        text_stripped = _PAREN_RE.sub('', text).strip()
         return text_stripped
 
-    def _find_column(self, df_columns: list, field: str) -> str | None:
-        """Find matching column name from dataframe."""
-        possible_names = self.COLUMN_MAPPINGS.get(field, [field])
+    @staticmethod
+    def _split_skills(raw: pd.Series) -> pd.Series:
+        """Comma-separated skill cells as lists of stripped names; non-text cells become []."""
+        is_text = raw.map(lambda v: isinstance(v, str)) & raw.ne("nan")
+        if not is_text.any():
+            return pd.Series([[]] * len(raw), index=raw.index)
+        parts = raw[is_text].str.split(",").explode().str.strip()
+        parts = parts[parts.ne("")]
+        skills = parts.groupby(level=0).agg(list).reindex(raw.index)
+        return skills.map(lambda v: v if isinstance(v, list) else [])
+
+    def _find_column(self, headers: list[tuple[str, str, str]], field: str) -> str | None:
+        """Find matching column name among (original, lowered, normalized) headers."""
+        possible_names = self._MAPPING_SETS.get(field, frozenset([field]))
         # First pass: exact match (lowered & stripped)
-        for col in df_columns:
-            if col.lower().strip() in possible_names:
+        for col, lowered, _ in headers:
+            if lowered in possible_names:
                 return col
         # Second pass: match after stripping parenthesized units like (%) ($)
-        for col in df_columns:
-            normalized = self._normalize(col)
+        for col, _, normalized in headers:
             if normalized in possible_names:
                 return col
         return None
 
+    @staticmethod
+    def _read_excel(file_path: str) -> pd.DataFrame:
+        """First sheet via calamine when installed, falling back to openpyxl if it can't read the file."""
+        if _EXCEL_ENGINE == "calamine":
+            try:
+                return pd.read_excel(file_path, engine="calamine")
+            except Exception as e:
+                logger.warning("calamine could not read %s (%s); retrying with openpyxl", file_path, e)
+        return pd.read_excel(file_path, engine="openpyxl")
+
     def process_employee_excel(
         self, file_path: str, db: Session, filename: str
     ) -> Tuple[int, int, list[str]]:
@@ -57,7 +92,7 @@ class ExcelProcessor:
         Returns (imported_count, skipped_count, errors).
         """
         try:
-            df = pd.read_excel(file_path, engine="openpyxl")
+            df = self._read_excel(file_path)
         except Exception as e:
             return 0, 0, [f"Failed to read Excel file: {str(e)}"]
 
@@ -66,79 +101,74 @@ class ExcelProcessor:
 
         # Normalize column names
         df.columns = [str(col).strip() for col in df.columns]
+        headers = [(col, col.lower().strip(), self._normalize(col)) for col in df.columns]
         col_map = {}
         for field in self.COLUMN_MAPPINGS:
-            matched = self._find_column(list(df.columns), field)
+            matched = self._find_column(headers, field)
             if matched:
                 col_map[field] = matched
 
         if "name" not in col_map:
             return 0, 0, ["Could not find a 'name' column in the Excel file"]
 
-        imported = 0
-        skipped = 0
         errors = []
 
-        for idx, row in df.iterrows():
-            try:
-                name = str(row.get(col_map.get("name", ""), "")).strip()
-                if not name or name == "nan":
-                    skipped += 1
-                    continue
-
-                email = str(row.get(col_map.get("email", ""), "")).strip()
-                if email == "nan":
-                    email = ""
-
-                # Check for duplicate by email
-                if email and db.query(Employee).filter(Employee.email == email).first():
-                    skipped += 1
-                    continue
-
-                # Parse skills - could be comma-separated string
-                skills_raw = row.get(col_map.get("skills", ""), "")
-                if isinstance(skills_raw, str) and skills_raw != "nan":
-                    skills = [s.strip() for s in skills_raw.split(",") if s.strip()]
-                else:
-                    skills = []
-
-                # Parse availability
-                avail = row.get(col_map.get("availability_percent", ""), 100)
-                try:
-                    avail = int(float(str(avail).replace("%", "")))
-                except (ValueError, TypeError):
-                    avail = 100
-
-                # Parse hourly rate
-                rate = row.get(col_map.get("hourly_rate", ""), 0)
-                try:
-                    rate = float(str(rate).replace("$", "").replace(",", ""))
-                except (ValueError, TypeError):
-                    rate = 0.0
-
-                employee = Employee(
-                    id=str(uuid.uuid4()),
-                    name=name,
-                    email=email if email else f"{name.lower().replace(' ', '.')}@company.com",
-                    role=str(row.get(col_map.get("role", ""), "Unknown")).strip(),
-                    department=str(row.get(col_map.get("department", ""), "General")).strip(),
-                    skills=skills,
-                    availability_percent=max(0, min(100, avail)),
-                    hourly_rate=rate,
-                    is_active=True,
-                    uploaded_from=filename,
-                )
-                db.add(employee)
-                imported += 1
-
-            except Exception as e:
-                errors.append(f"Row {idx + 2}: {str(e)}")
-                skipped += 1
-
-        if imported > 0:
-            db.commit()
-
-        return imported, skipped, errors
+        def text(field: str, default: str) -> pd.Series:
+            """Column as stripped strings (NaN -> "nan", like str()); a constant if unmapped."""
+            if field not in col_map:
+                return pd.Series(default, index=df.index)
+            return df[col_map[field]].astype(str).str.strip()
+
+        def numeric(field: str, default: float, strip_chars: str, label: str) -> pd.Series:
+            """Column parsed as floats after removing ``strip_chars``; blanks and junk become ``default``."""
+            if field not in col_map:
+                return pd.Series(default, index=df.index, dtype=float)
+            raw = df[col_map[field]]
+            cleaned = raw.astype(str).str.strip()
+            for ch in strip_chars:
+                cleaned = cleaned.str.replace(ch, "", regex=False)
+            values = pd.to_numeric(cleaned, errors="coerce")
+            invalid = values.isna() & raw.notna() & cleaned.ne("") & keep
+            for idx in invalid[invalid].index:
+                errors.append(f"Row {idx + 2}: invalid {label} '{raw[idx]}', using {default:g}")
+            return values.fillna(default)
+
+        names = text("name", "")
+        emails = text("email", "").replace("nan", "")
+
+        # Rows without a name are skipped
+        keep = names.ne("") & names.ne("nan")
+
+        # Duplicate emails — already in the DB (one query) or repeated earlier in the sheet
+        existing_emails = {email for (email,) in db.query(Employee.email).all()}
+        has_email = emails.ne("")
+        duplicate = has_email & (emails.isin(existing_emails) | (emails.where(keep).duplicated() & keep))
+        keep &= ~duplicate
+
+        skipped = int((~keep).sum())
+        if not keep.any():
+            return 0, skipped, errors
+
+        clean = pd.DataFrame({
+            "name": names,
+            "email": emails.where(has_email, names.str.lower().str.replace(" ", ".", regex=False) + "@company.com"),
+            "role": text("role", "Unknown"),
+            "department": text("department", "General"),
+            "skills": self._split_skills(df[col_map["skills"]]) if "skills" in col_map
+            else pd.Series([[]] * len(df), index=df.index),
+            "availability_percent": numeric("availability_percent", 100, "%", "availability")
+            .clip(0, 100).astype(int),
+            "hourly_rate": numeric("hourly_rate", 0.0, "$,", "hourly rate"),
+        })[keep]
+        clean.insert(0, "id", [str(uuid.uuid4()) for _ in range(len(clean))])
+        clean["is_active"] = True
+        clean["uploaded_from"] = filename
+
+        records = clean.to_dict("records")
+        db.execute(insert(Employee), records)
+        db.commit()
+
+        return len(records), skipped, errors
 
 
 excel_processor = ExcelProcessor()
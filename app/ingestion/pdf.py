@@ -1,83 +1,380 @@
 import fitz  # PyMuPDF
+import hashlib
+import logging
+import multiprocessing
+import os
+import orjson
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 from typing import Optional
 import json
+from app.config import settings
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # cache entries are then stored as plain JSON
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+# Pages and sections are built, merged and cached column-wise ({column: [values]});
+# extract() turns them into its list-of-dicts layout only on the way out
+_PAGE_COLUMNS = ("page_number", "text", "word_count")
+_SECTION_COLUMNS = ("title", "page", "font_size")
+
+# Column fields kept as zstd Parquet tables (when pyarrow is installed) rather than in the JSON entry
+_COLUMNAR_FIELDS = {"extract": ("pages", "sections"), "extract-text": ("pages", "sections")}
+
+# Bumped whenever the layout of cached results changes; older entries are treated as misses
+_CACHE_FORMAT = 2
+
+
+def _extract_kind(detect_sections: bool) -> str:
+    """Cache kind for extract() results (text-only results are cached separately)."""
+    return "extract" if detect_sections else "extract-text"
+
+
+def _rows(columns: dict, names: tuple) -> list[dict]:
+    """Parallel column lists → list of row dicts."""
+    return [dict(zip(names, row)) for row in zip(*[columns[name] for name in names])]
+
+
+def _page_tables(tables, page_num: int) -> list[dict]:
+    """Structured rows of the tables found on one page (header row + at least one data row)."""
+    page_tables = []
+    for table in tables.tables:
+        table_data = table.extract()
+        if table_data and len(table_data) > 1:
+            headers = table_data[0]
+            rows = table_data[1:]
+            page_tables.append({
+                "page": page_num + 1,
+                "headers": headers,
+                "rows": rows,
+                "row_count": len(rows),
+            })
+    return page_tables
+
+
+def _extract_page_range(doc, start: int, stop: int, with_tables: bool = False,
+                        detect_sections: bool = True) -> tuple[dict, dict, int, list]:
+    """Pages [start, stop) of an open document → (page columns, section columns, table count, tables).
+
+    ``tables`` holds the structured table rows when ``with_tables`` is set, else it is empty.
+    Without ``detect_sections`` no sections are collected and the page text comes from
+    the cheaper "text" mode.
+    """
+    count = stop - start
+    texts = [""] * count
+    word_counts = [0] * count
+    titles = []
+    heading_pages = []
+    font_sizes = []
+    tables_found = 0
+    structured_tables = []
+
+    for i, page_num in enumerate(range(start, stop)):
+        page = doc[page_num]
+
+        if detect_sections:
+            # One "dict" pass with the plain-text flags (no image blocks) gives both the page
+            # text — each line's spans joined, one line per row, same as get_text("text") —
+            # and the span font sizes used for section detection
+            blocks = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]
+            lines = [line["spans"] for block in blocks for line in block.get("lines", ())]
+            line_texts = ["".join([span["text"] for span in spans]) for spans in lines]
+
+            # Detect sections by font size (larger = heading)
+            headings = [span for spans in lines for span in spans if span["size"] > 14]  # Likely a heading
+            if headings:
+                titles.extend([span["text"].strip() for span in headings])
+                heading_pages.extend([page_num + 1] * len(headings))
+                font_sizes.extend([span["size"] for span in headings])
+
+            page_text = "".join([text + "\n" for text in line_texts])
+        else:
+            # Text only: no per-block / per-span dicts are built
+            page_text = page.get_text("text", flags=fitz.TEXTFLAGS_TEXT)
+        texts[i] = page_text
+        word_counts[i] = len(page_text.split())
+
+        # Detect tables
+        tables = page.find_tables()
+        if tables:
+            tables_found += len(tables.tables)
+            if with_tables:
+                structured_tables.extend(_page_tables(tables, page_num))
+
+    pages = {"page_number": list(range(start + 1, stop + 1)), "text": texts, "word_count": word_counts}
+    sections = {"title": titles, "page": heading_pages, "font_size": font_sizes}
+    return pages, sections, tables_found, structured_tables
+
+
+def _extract_page_range_from_path(file_path: str, start: int, stop: int, with_tables: bool = False,
+                                  detect_sections: bool = True) -> tuple[dict, dict, int, list]:
+    """Worker-process entry point: each worker opens its own copy of the document."""
+    with fitz.open(file_path) as doc:
+        return _extract_page_range(doc, start, stop, with_tables, detect_sections)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Process pool shared by all extractions (spawned, so workers don't inherit server threads)."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.PDF_EXTRACT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def _digest(data: bytes) -> tuple[str, int]:
+    """(sha256 hex digest, size in bytes) of a PDF's contents."""
+    return hashlib.sha256(data).hexdigest(), len(data)
+
+
+def _open(data: bytes):
+    """Open a PDF from bytes already in memory (MuPDF then parses without re-reading the file)."""
+    return fitz.open(stream=data, filetype="pdf")
+
+
+class _ResultCache:
+    """On-disk cache of extraction results keyed by the PDF's content hash.
+
+    Entries are JSON files named ``{sha256}.{kind}.json`` under PDF_CACHE_DIR; the
+    file size and _CACHE_FORMAT are stored alongside the result and checked on read. With pyarrow
+    installed, the bulky per-page / per-heading lists go to
+    ``{sha256}.{kind}.{field}.parquet`` and the JSON keeps only the scalars.
+    """
+
+    def _path(self, digest: str, kind: str, suffix: str = "json") -> Path:
+        return settings.pdf_cache_path / f"{digest}.{kind}.{suffix}"
+
+    def load(self, digest: str, size: int, kind: str):
+        try:
+            entry = orjson.loads(self._path(digest, kind).read_bytes())
+            if entry.get("size") != size or entry.get("format") != _CACHE_FORMAT:
+                return None
+            result = entry.get("result")
+            columnar = entry.get("columnar", ())
+            if columnar and pq is None:
+                return None  # written by a process that had pyarrow
+            for field in columnar:
+                result[field] = pq.read_table(self._path(digest, kind, f"{field}.parquet")).to_pydict()
+            os.utime(self._path(digest, kind))  # mark as recently used for eviction
+            return result
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:  # includes JSON decode and Arrow errors
+            logger.warning("PDF cache: unreadable entry %s.%s (%s)", digest[:12], kind, e)
+            return None
+
+    def store(self, digest: str, size: int, kind: str, result) -> None:
+        columnar = _COLUMNAR_FIELDS.get(kind, ()) if pq is not None else ()
+        entry = {"size": size, "format": _CACHE_FORMAT, "result": result}
+        if columnar:
+            entry["result"] = {k: v for k, v in result.items() if k not in columnar}
+            entry["columnar"] = list(columnar)
+
+        tmps = []
+        try:
+            for field in columnar:
+                path = self._path(digest, kind, f"{field}.parquet")
+                tmp = path.with_suffix(f".{os.getpid()}.tmp")
+                tmps.append(tmp)
+                pq.write_table(pa.Table.from_pydict(result[field]), tmp, compression="zstd")
+                os.replace(tmp, path)
+            # The JSON entry goes last, so readers only find it once its tables are in place
+            path = self._path(digest, kind)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmps.append(tmp)
+            tmp.write_bytes(orjson.dumps(entry))
+            os.replace(tmp, path)  # atomic, so concurrent readers never see a partial file
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning("PDF cache: could not store %s.%s (%s)", digest[:12], kind, e)
+            for tmp in tmps:
+                tmp.unlink(missing_ok=True)
+            return
+        self._prune()
+
+    def _prune(self) -> None:
+        """Evict least-recently-used files' entries (all kinds together) until under PDF_CACHE_MAX_MB.
+
+        Runs after each store, i.e. only after a full parse, so one directory scan is cheap.
+        """
+        limit = settings.PDF_CACHE_MAX_MB * 1024 * 1024
+        if limit <= 0:
+            return
+        groups = {}  # digest -> [bytes, latest mtime, paths]
+        total = 0
+        try:
+            for entry in os.scandir(settings.pdf_cache_path):
+                if not entry.is_file() or entry.name.endswith(".tmp"):
+                    continue
+                stat = entry.stat()
+                group = groups.setdefault(entry.name.split(".", 1)[0], [0, 0.0, []])
+                group[0] += stat.st_size
+                group[1] = max(group[1], stat.st_mtime)
+                group[2].append(entry.path)
+                total += stat.st_size
+        except OSError as e:
+            logger.warning("PDF cache: could not scan %s (%s)", settings.PDF_CACHE_DIR, e)
+            return
+        if total <= limit:
+            return
+
+        evicted = 0
+        for size, _, paths in sorted(groups.values(), key=lambda group: group[1]):
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass  # already evicted by another process
+                except OSError as e:
+                    logger.warning("PDF cache: could not evict %s (%s)", path, e)
+            total -= size
+            evicted += 1
+            if total <= limit:
+                break
+        logger.info("PDF cache: evicted %d file(s)' entries, %.1f MB left", evicted, total / (1024 * 1024))
+
+
+_result_cache = _ResultCache()
 
 
 class PDFExtractor:
     """Extract text, tables, and metadata from PDF documents using PyMuPDF."""
 
-    def extract(self, file_path: str) -> dict:
+    def _cached(self, file_path: str, kind: str, force_refresh: bool, compute):
+        """Result of ``compute(file_path, data)``, served from / saved to the content-hash cache.
+
+        The file is read once; the same bytes are hashed and handed to MuPDF.
+        """
+        data = Path(file_path).read_bytes()
+        if not settings.PDF_CACHE_ENABLED:
+            return compute(file_path, data)
+        digest, size = _digest(data)
+        if not force_refresh:
+            cached = _result_cache.load(digest, size, kind)
+            if cached is not None:
+                logger.info("PDF cache hit: %s (%s)", Path(file_path).name, kind)
+                return cached
+        result = compute(file_path, data)
+        _result_cache.store(digest, size, kind, result)
+        return result
+
+    @staticmethod
+    def _with_text(result: dict) -> dict:
+        """Column-wise internal result → extract()'s layout (lists of page / section dicts)."""
+        pages = result["pages"]
+        # Full text is derived from the per-page texts rather than stored twice (in memory or on disk)
+        result["text"] = "\n\n".join(pages["text"])
+        result["pages"] = _rows(pages, _PAGE_COLUMNS)
+        result["sections"] = _rows(result["sections"], _SECTION_COLUMNS)
+        return result
+
+    def extract(self, file_path: str, force_refresh: bool = False, detect_sections: bool = True) -> dict:
         """
         Extract all content from a PDF file.
         Returns dict with: text, pages, page_count, metadata, sections, tables_found
+
+        Results are cached on disk by file content; ``force_refresh`` re-parses and
+        overwrites the cached entry. Callers that only need text can pass
+        ``detect_sections=False`` to skip font-size heading detection ("sections" is then empty).
+        """
+        compute = partial(self._extract, detect_sections=detect_sections)
+        return self._with_text(self._cached(file_path, _extract_kind(detect_sections), force_refresh, compute))
+
+    def extract_tables(self, file_path: str, force_refresh: bool = False) -> list[dict]:
+        """Extract tables as structured data (cached on disk like extract())."""
+        return self._cached(file_path, "tables", force_refresh, self._extract_tables)
+
+    def extract_all(self, file_path: str, force_refresh: bool = False,
+                    detect_sections: bool = True) -> tuple[dict, list[dict]]:
+        """extract() and extract_tables() from a single open and a single find_tables() pass per page."""
+        kind = _extract_kind(detect_sections)
+        data = Path(file_path).read_bytes()
+        digest = size = None
+        if settings.PDF_CACHE_ENABLED:
+            digest, size = _digest(data)
+            if not force_refresh:
+                content = _result_cache.load(digest, size, kind)
+                tables = _result_cache.load(digest, size, "tables")
+                if content is not None and tables is not None:
+                    logger.info("PDF cache hit: %s (%s + tables)", Path(file_path).name, kind)
+                    return self._with_text(content), tables
+
+        with _open(data) as doc:
+            content, tables = self._extract_with_doc(doc, file_path, with_tables=True,
+                                                     detect_sections=detect_sections)
+
+        if digest is not None:
+            _result_cache.store(digest, size, kind, content)
+            _result_cache.store(digest, size, "tables", tables)
+        return self._with_text(content), tables
+
+    def _extract(self, file_path: str, data: bytes, detect_sections: bool = True) -> dict:
+        """Uncached extract() in the column-wise layout, without the joined "text" (extract() adds it)."""
+        with _open(data) as doc:
+            content, _ = self._extract_with_doc(doc, file_path, detect_sections=detect_sections)
+        return content
+
+    def _extract_tables(self, file_path: str, data: bytes) -> list[dict]:
+        with _open(data) as doc:
+            return self._extract_tables_with_doc(doc)
+
+    def _extract_with_doc(self, doc, file_path: str, with_tables: bool = False,
+                          detect_sections: bool = True) -> tuple[dict, list[dict]]:
+        """Column-wise content (minus "text") and, with ``with_tables``, structured tables of an open document.
+
+        Documents with at least PDF_PARALLEL_MIN_PAGES pages are split into one
+        contiguous page range per worker process (each reopens ``file_path``);
+        smaller ones are read from ``doc`` in-process.
         """
-        doc = fitz.open(file_path)
+        page_count = len(doc)
         result = {
             "text": "",
-            "pages": [],
-            "page_count": len(doc),
+            "pages": {name: [] for name in _PAGE_COLUMNS},
+            "page_count": page_count,
             "metadata": doc.metadata,
-            "sections": [],
+            "sections": {name: [] for name in _SECTION_COLUMNS},
             "tables_found": 0,
         }
+        structured_tables = []
 
-        full_text_parts = []
+        workers = min(settings.PDF_EXTRACT_WORKERS, os.cpu_count() or 1, page_count)
+        if workers < 2 or page_count < settings.PDF_PARALLEL_MIN_PAGES:
+            chunks = [_extract_page_range(doc, 0, page_count, with_tables, detect_sections)]
+        else:
+            step = -(-page_count // workers)  # ceil division
+            futures = [
+                _get_pool().submit(
+                    _extract_page_range_from_path, file_path, start, min(start + step, page_count),
+                    with_tables, detect_sections,
+                )
+                for start in range(0, page_count, step)
+            ]
+            chunks = [future.result() for future in futures]  # already in page order
 
-        for page_num, page in enumerate(doc):
-            page_text = page.get_text("text")
-            full_text_parts.append(page_text)
-
-            # Extract text blocks with positioning for section detection
-            blocks = page.get_text("dict")["blocks"]
-            page_data = {
-                "page_number": page_num + 1,
-                "text": page_text,
-                "word_count": len(page_text.split()),
-            }
-            result["pages"].append(page_data)
+        for pages, sections, tables_found, tables in chunks:
+            for name in _PAGE_COLUMNS:
+                result["pages"][name].extend(pages[name])
+            for name in _SECTION_COLUMNS:
+                result["sections"][name].extend(sections[name])
+            result["tables_found"] += tables_found
+            structured_tables.extend(tables)
 
-            # Detect sections by font size (larger = heading)
-            for block in blocks:
-                if "lines" in block:
-                    for line in block["lines"]:
-                        for span in line["spans"]:
-                            if span["size"] > 14:  # Likely a heading
-                                result["sections"].append({
-                                    "title": span["text"].strip(),
-                                    "page": page_num + 1,
-                                    "font_size": span["size"],
-                                })
-
-            # Detect tables
-            tables = page.find_tables()
-            if tables:
-                result["tables_found"] += len(tables.tables)
-
-        result["text"] = "\n\n".join(full_text_parts)
-        doc.close()
-        return result
+        return result, structured_tables
 
-    def extract_tables(self, file_path: str) -> list[dict]:
-        """Extract tables as structured data."""
-        doc = fitz.open(file_path)
+    def _extract_tables_with_doc(self, doc) -> list[dict]:
         all_tables = []
-
         for page_num, page in enumerate(doc):
-            tables = page.find_tables()
-            for table in tables.tables:
-                table_data = table.extract()
-                if table_data and len(table_data) > 1:
-                    headers = table_data[0]
-                    rows = table_data[1:]
-                    all_tables.append({
-                        "page": page_num + 1,
-                        "headers": headers,
-                        "rows": rows,
-                        "row_count": len(rows),
-                    })
-
-        doc.close()
+            all_tables.extend(_page_tables(page.find_tables(), page_num))
         return all_tables
 
 
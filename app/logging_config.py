@@ -9,7 +9,7 @@ Usage in any module:
 
 import logging
 import sys
-from datetime import datetime
+import time
 
 
 # ── ANSI colours for terminal ──────────────────────────────────────────
@@ -39,6 +39,9 @@ LEVEL_COLOURS = {
     "CRITICAL": Colours.CRITICAL,
 }
 
+# Coloured, padded level tags, built once
+_LEVEL_TAG = {name: f"{colour}{name:<7}{Colours.RESET}" for name, colour in LEVEL_COLOURS.items()}
+
 # Map logger names to short tags + colours
 CATEGORY_MAP = {
     "app.services.llm":          ("LLM",       Colours.LLM),
@@ -57,42 +60,70 @@ CATEGORY_MAP = {
     "main":                      ("SERVER",    Colours.BOLD),
 }
 
+# Longest prefix first, so "app.rag.vectorstore" wins over "app.rag"
+_CAT_ITEMS = sorted(CATEGORY_MAP.items(), key=lambda kv: -len(kv[0]))
+
+# Resolved (tag, colour) per logger name — the set of logger names is small and fixed
+_CAT_CACHE: dict[str, tuple[str, str]] = {}
+
+
+def _category(name: str) -> tuple[str, str]:
+    """Category tag + colour for a logger name, resolved once per name."""
+    tag_colour = _CAT_CACHE.get(name)
+    if tag_colour is None:
+        for prefix, (tag, colour) in _CAT_ITEMS:
+            if name.startswith(prefix):
+                tag_colour = (tag, colour)
+                break
+        else:
+            # Fallback: last part of logger name
+            tag_colour = (name.rsplit(".", 1)[-1].upper()[:10], Colours.DIM)
+        _CAT_CACHE[name] = tag_colour
+    return tag_colour
+
+
+def _timestamp(record: logging.LogRecord) -> str:
+    """HH:MM:SS.mmm local time of a record."""
+    return f"{time.strftime('%H:%M:%S', time.localtime(record.created))}.{int(record.msecs):03d}"
+
 
 class DealMindFormatter(logging.Formatter):
     """Custom formatter: coloured level + category tag + message."""
 
+    def _exception(self, record: logging.LogRecord) -> str:
+        # Include exception info if present
+        if record.exc_info and record.exc_info[0]:
+            return f"\n{self.formatException(record.exc_info)}"
+        return ""
+
     def format(self, record: logging.LogRecord) -> str:
-        ts = datetime.fromtimestamp(record.created).strftime("%H:%M:%S.%f")[:-3]
-
-        level_colour = LEVEL_COLOURS.get(record.levelname, Colours.RESET)
-        level_tag = f"{level_colour}{record.levelname:<7}{Colours.RESET}"
-
-        # Resolve category tag
-        cat_tag = ""
-        cat_colour = Colours.DIM
-        for prefix, (tag, colour) in CATEGORY_MAP.items():
-            if record.name.startswith(prefix):
-                cat_tag = tag
-                cat_colour = colour
-                break
-        if not cat_tag:
-            # Fallback: last part of logger name
-            cat_tag = record.name.rsplit(".", 1)[-1].upper()[:10]
+        ts = _timestamp(record)
+
+        level_tag = _LEVEL_TAG.get(record.levelname)
+        if level_tag is None:
+            level_tag = f"{Colours.RESET}{record.levelname:<7}{Colours.RESET}"
 
+        cat_tag, cat_colour = _category(record.name)
         category = f"{cat_colour}[{cat_tag}]{Colours.RESET}"
 
         msg = record.getMessage()
 
-        # Include exception info if present
-        exc = ""
-        if record.exc_info and record.exc_info[0]:
-            exc = f"\n{self.formatException(record.exc_info)}"
+        return f"{Colours.DIM}{ts}{Colours.RESET} {level_tag} {category} {msg}{self._exception(record)}"
+
 
-        return f"{Colours.DIM}{ts}{Colours.RESET} {level_tag} {category} {msg}{exc}"
+class PlainFormatter(DealMindFormatter):
+    """Same layout without ANSI colours, for output that isn't a terminal (files, log collectors)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        cat_tag, _ = _category(record.name)
+        return (
+            f"{_timestamp(record)} {record.levelname:<7} [{cat_tag}] "
+            f"{record.getMessage()}{self._exception(record)}"
+        )
 
 
 def setup_logging(level: str = "DEBUG"):
-    """Configure root logger with DealMind formatter.
+    """Configure root logger with DealMind formatter (uncoloured when stdout isn't a TTY).
 
     Call once at application startup (in main.py lifespan).
     """
@@ -104,7 +135,7 @@ def setup_logging(level: str = "DEBUG"):
         root.removeHandler(h)
 
     handler = logging.StreamHandler(sys.stdout)
-    handler.setFormatter(DealMindFormatter())
+    handler.setFormatter(DealMindFormatter() if sys.stdout.isatty() else PlainFormatter())
     root.addHandler(handler)
 
     # Quiet down noisy third-party loggers
@@ -9,7 +9,7 @@ The registry provides:
 import inspect
 import json
 import logging
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, Callable, Dict, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +21,11 @@ class MCPToolRegistry:
         self.name = name
         self._tools: Dict[str, Callable] = {}
         self._schemas: Dict[str, dict] = {}
+        self._param_names: Dict[str, frozenset] = {}  # keyword args each tool accepts
+        self._is_async: Dict[str, bool] = {}
+        # Discovery output only changes on register(), so it is built once and reused
+        self._schemas_tuple: Optional[Tuple[dict, ...]] = None
+        self._prompt_cache: Optional[str] = None
 
     # ── Registration ──
 
@@ -40,6 +45,8 @@ class MCPToolRegistry:
             input_schema: JSON Schema for the tool's input parameters
         """
         self._tools[name] = func
+        self._param_names[name] = frozenset(inspect.signature(func).parameters)
+        self._is_async[name] = inspect.iscoroutinefunction(func)
         self._schemas[name] = {
             "name": name,
             "description": description,
@@ -48,16 +55,23 @@ class MCPToolRegistry:
                 **input_schema,
             },
         }
+        self._schemas_tuple = None
+        self._prompt_cache = None
         logger.info("MCP tool registered: %s", name)
 
     # ── Discovery ──
 
-    def list_tools(self) -> List[dict]:
+    def list_tools(self) -> Tuple[dict, ...]:
         """Return all tool schemas in MCP-compatible format."""
-        return list(self._schemas.values())
+        if self._schemas_tuple is None:
+            self._schemas_tuple = tuple(self._schemas.values())
+        return self._schemas_tuple
 
     def get_tools_for_prompt(self) -> str:
         """Format tool descriptions for inclusion in an LLM prompt."""
+        if self._prompt_cache is not None:
+            return self._prompt_cache
+
         lines = []
         for schema in self._schemas.values():
             name = schema["name"]
@@ -74,7 +88,8 @@ class MCPToolRegistry:
             param_block = "\n".join(params) if params else "    (no parameters)"
             lines.append(f"- **{name}**: {desc}\n  Input:\n{param_block}")
 
-        return "\n".join(lines)
+        self._prompt_cache = "\n".join(lines)
+        return self._prompt_cache
 
     # ── Execution ──
 
@@ -103,17 +118,16 @@ class MCPToolRegistry:
 
         # Inject context values ONLY for params the function accepts
         if context:
-            sig = inspect.signature(func)
-            for key, value in context.items():
-                if key in sig.parameters and key not in merged:
-                    merged[key] = value
+            accepted = self._param_names[name]
+            merged.update({k: v for k, v in context.items() if k in accepted and k not in merged})
 
         logger.info("MCP execute: %s(%s)", name, list(merged.keys()))
 
         try:
-            result = func(**merged)
-            if inspect.iscoroutine(result):
-                result = await result
+            if self._is_async[name]:
+                result = await func(**merged)
+            else:
+                result = func(**merged)
             return {"status": "ok", "result": result}
         except Exception as exc:
             logger.error("MCP tool %s failed: %s", name, exc)
@@ -78,8 +78,9 @@ class RAGRetriever:
         query = f"Deal context: {deal_context}\n\nKey requirements:\n"
         query += "\n".join(f"- {req}" for req in requirements[:5])
 
-        # Search across all relevant collections
+        # Search across all relevant collections — the query is embedded once and reused
         collections_to_search = ["proposals", "rfps", "general"]
+        query_embedding = vector_store.embedder.embed_text(query)
         all_results = []
 
         for coll_name in collections_to_search:
@@ -88,6 +89,7 @@ class RAGRetriever:
                     collection_name=coll_name,
                     query_text=query,
                     n_results=n_results,
+                    query_embedding=query_embedding,
                 )
                 for doc, meta, dist in zip(
                     results["documents"], results["metadatas"], results["distances"]
@@ -129,6 +131,7 @@ class RAGRetriever:
         n_results: int = 5,
     ) -> List[Dict[str, Any]]:
         """Retrieve context from multiple collections for deal analysis."""
+        query_embedding = vector_store.embedder.embed_text(query)
         all_results = []
 
         for collection in collection_names:
@@ -136,6 +139,7 @@ class RAGRetriever:
                 collection_name=collection,
                 query_text=query,
                 n_results=n_results,
+                query_embedding=query_embedding,
             )
             for doc, meta, dist in zip(
                 results["documents"], results["metadatas"], results["distances"]
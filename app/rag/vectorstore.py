@@ -117,10 +117,16 @@ class VectorStore:
         query_text: str,
         n_results: int = 5,
         where: Optional[Dict] = None,
+        query_embedding: Optional[List[float]] = None,
     ) -> Dict[str, Any]:
-        """Query a collection for similar documents."""
+        """Query a collection for similar documents.
+
+        Pass ``query_embedding`` when the same query runs against several collections
+        so the text is only embedded once.
+        """
         collection = self.get_or_create_collection(collection_name)
-        query_embedding = self.embedder.embed_text(query_text)
+        if query_embedding is None:
+            query_embedding = self.embedder.embed_text(query_text)
 
         results = collection.query(
             query_embeddings=[query_embedding],
@@ -233,12 +233,17 @@ class ProposalChatRequest(BaseModel):
     history: List[ChatMessage] = []
 
 
+# Opening / closing markdown fences around an LLM JSON reply
+_FENCE_OPEN_RE = re.compile(r"^```(?:json)?\s*\n?")
+_FENCE_CLOSE_RE = re.compile(r"\n?```\s*$")
+
+
 def _clean_json_block(text: str) -> str:
     """Strip markdown code-block wrappers from a JSON string."""
     cleaned = text.strip()
     if cleaned.startswith("```"):
-        cleaned = re.sub(r"^```(?:json)?\s*\n?", "", cleaned)
-        cleaned = re.sub(r"\n?```\s*$", "", cleaned)
+        cleaned = _FENCE_OPEN_RE.sub("", cleaned)
+        cleaned = _FENCE_CLOSE_RE.sub("", cleaned)
         cleaned = cleaned.strip()
     return cleaned
 
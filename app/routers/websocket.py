@@ -1,7 +1,7 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
 from app.websocket.manager import ws_manager
 from app.agents.orchestrator import task_store
-import json
+import orjson
 
 router = APIRouter(tags=["WebSocket"])
 
@@ -17,14 +17,14 @@ async def agent_status_websocket(websocket: WebSocket, task_id: str):
     try:
         # Send current status if task exists
         if task_id in task_store:
-            await websocket.send_text(json.dumps(task_store[task_id]))
+            await websocket.send_text(orjson.dumps(task_store[task_id]).decode())
 
         # Keep connection alive and listen for client messages
         while True:
             data = await websocket.receive_text()
             # Client can send "ping" to keep alive
             if data == "ping":
-                await websocket.send_text(json.dumps({"type": "pong"}))
+                await websocket.send_text(orjson.dumps({"type": "pong"}).decode())
     except WebSocketDisconnect:
         ws_manager.disconnect(websocket, task_id=task_id)
 
@@ -41,6 +41,6 @@ async def dashboard_websocket(websocket: WebSocket, user_id: str = Query(default
         while True:
             data = await websocket.receive_text()
             if data == "ping":
-                await websocket.send_text(json.dumps({"type": "pong"}))
+                await websocket.send_text(orjson.dumps({"type": "pong"}).decode())
     except WebSocketDisconnect:
         ws_manager.disconnect(websocket, user_id=user_id or "anonymous")
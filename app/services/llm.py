@@ -1,17 +1,42 @@
 """Shared LLM client — uses OpenRouter (OpenAI-compatible) with free models."""
 import re
 import time
+import hashlib
 import logging
-from openai import OpenAI
+import threading
+import httpx
+import orjson
+from collections import OrderedDict
+from typing import AsyncIterator, Iterator
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
-# OpenRouter client (OpenAI-compatible API)
+# Shared keep-alive pool so concurrent nodes reuse TCP/TLS connections to OpenRouter
+# (the SDK's Default*HttpxClient keep its timeout / redirect defaults)
+_http_limits = httpx.Limits(
+    max_connections=settings.LLM_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.LLM_MAX_CONNECTIONS,
+)
+
+# OpenRouter clients (OpenAI-compatible API) — sync for worker-thread nodes, async for coroutine nodes
 client = OpenAI(
     api_key=settings.OPENROUTER_API_KEY,
     base_url="https://openrouter.ai/api/v1",
+    http_client=DefaultHttpxClient(limits=_http_limits),
 )
+async_client = AsyncOpenAI(
+    api_key=settings.OPENROUTER_API_KEY,
+    base_url="https://openrouter.ai/api/v1",
+    http_client=DefaultAsyncHttpxClient(limits=_http_limits),
+)
+
+
+async def close_clients() -> None:
+    """Close the pooled LLM connections (app shutdown)."""
+    await async_client.close()
+    client.close()
 
 # Default model
 DEFAULT_MODEL = settings.LLM_MODEL
@@ -25,37 +50,350 @@ def _strip_think_tags(text: str) -> str:
     return _THINK_RE.sub("", text).strip()
 
 
-def call_llm(prompt: str, max_tokens: int = 2048, model: str = None) -> str:
-    """Call the LLM with a single user prompt and return the text response."""
+# First ``` / ```json fenced block (an unterminated fence runs to the end of the text)
+_FENCE_RE = re.compile(r"```(?:json)?\s*([\s\S]*?)\s*(?:```|$)", re.IGNORECASE)
+
+
+def strip_code_fence(text: str) -> str:
+    """Return the body of the first markdown code fence, or the stripped text if there is none."""
+    m = _FENCE_RE.search(text)
+    return m.group(1) if m else text.strip()
+
+
+# Braces and complete string literals — strings are matched whole so braces inside them are skipped
+_JSON_TOKEN_RE = re.compile(r'"(?:\\.|[^"\\])*"|[{}]')
+
+
+def extract_json_object(text: str, required_key: str | None = None) -> dict | None:
+    """First balanced top-level JSON object in an LLM response, found in one scan.
+
+    Works whether or not the object is wrapped in a code fence or surrounded by prose.
+    With ``required_key``, objects lacking that key are skipped. Returns None if nothing parses.
+    """
+    depth = 0
+    start = -1
+    for m in _JSON_TOKEN_RE.finditer(text):
+        token = m.group()
+        if token == "{":
+            if depth == 0:
+                start = m.start()
+            depth += 1
+        elif token == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                try:
+                    obj = orjson.loads(text[start:m.end()])
+                except orjson.JSONDecodeError:
+                    continue
+                if isinstance(obj, dict) and (required_key is None or required_key in obj):
+                    return obj
+    return None
+
+
+# In-process LRU of cleaned responses, keyed by sha256(model + max_tokens + prefix + prompt)
+_response_cache: "OrderedDict[str, str]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_key(prompt: str, max_tokens: int, model: str, prefix: str = "") -> str:
+    return hashlib.sha256(f"{model}\x00{max_tokens}\x00{prefix}\x00{prompt}".encode()).hexdigest()
+
+
+def _cache_get(key: str) -> str | None:
+    with _cache_lock:
+        value = _response_cache.get(key)
+        if value is not None:
+            _response_cache.move_to_end(key)
+        return value
+
+
+def _cache_put(key: str, value: str) -> None:
+    with _cache_lock:
+        _response_cache[key] = value
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > settings.LLM_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
+
+def _user_content(prompt: str, cacheable_prefix: str | None):
+    """Message content for the user turn.
+
+    A static prefix is sent as its own text part marked ``cache_control`` so providers
+    with prompt caching (Anthropic, Gemini via OpenRouter) can reuse its prefill;
+    others just see the two parts in order.
+    """
+    if not cacheable_prefix:
+        return prompt
+    if not settings.LLM_PROMPT_CACHING:
+        return cacheable_prefix + prompt
+    return [
+        {"type": "text", "text": cacheable_prefix, "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": prompt},
+    ]
+
+
+def _cache_lookup(prompt: str, max_tokens: int, model: str, cache: bool,
+                  cacheable_prefix: str | None) -> tuple[str | None, str | None]:
+    """(cache_key, cached_response) for a call; both None when response caching is off."""
+    if not (cache and settings.LLM_CACHE_ENABLED):
+        return None, None
+    cache_key = _cache_key(prompt, max_tokens, model, cacheable_prefix or "")
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        logger.info("LLM cache hit → model=%s  key=%s…", model, cache_key[:12])
+    return cache_key, cached
+
+
+def _log_call(model: str, max_tokens: int, prompt: str, cacheable_prefix: str | None) -> None:
+    prompt_preview = (cacheable_prefix or prompt)[:120].replace("\n", " ")
+    logger.info("LLM call → model=%s  max_tokens=%d  prompt='%s…'", model, max_tokens, prompt_preview)
+
+
+def _finish_response(response, t0: float, cache_key: str | None) -> str:
+    """Log timing/usage, strip reasoning blocks and fill the response cache."""
+    raw = response.choices[0].message.content or ""
+    elapsed = time.perf_counter() - t0
+
+    # Token usage (if provided by OpenRouter)
+    usage = response.usage
+    tokens_info = ""
+    if usage:
+        tokens_info = f"  tokens(in={usage.prompt_tokens}, out={usage.completion_tokens})"
+        cached_tokens = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None)
+        if cached_tokens:
+            tokens_info += f"  cached={cached_tokens}"
+
+    cleaned = _strip_think_tags(raw)
+    logger.info(
+        "LLM done ← %.1fs  raw_len=%d  clean_len=%d%s",
+        elapsed, len(raw), len(cleaned), tokens_info,
+    )
+    logger.debug("LLM raw response (first 300 chars): %s", raw[:300])
+
+    if cache_key and cleaned:
+        _cache_put(cache_key, cleaned)
+    return cleaned
+
+
+def call_llm(prompt: str, max_tokens: int = 2048, model: str = None, cache: bool = False,
+             cacheable_prefix: str | None = None) -> str:
+    """Call the LLM with a single user prompt and return the text response.
+
+    With ``cache=True`` (and LLM_CACHE_ENABLED set) an identical prompt reuses
+    the previous response instead of making another round-trip.
+    ``cacheable_prefix`` is text that precedes ``prompt`` and stays the same across
+    calls; it is marked for provider-side prompt caching.
+    """
     used_model = model or DEFAULT_MODEL
-    prompt_preview = prompt[:120].replace("\n", " ")
-    logger.info("LLM call → model=%s  max_tokens=%d  prompt='%s…'", used_model, max_tokens, prompt_preview)
+    cache_key, cached = _cache_lookup(prompt, max_tokens, used_model, cache, cacheable_prefix)
+    if cached is not None:
+        return cached
+    _log_call(used_model, max_tokens, prompt, cacheable_prefix)
 
     t0 = time.perf_counter()
     try:
         response = client.chat.completions.create(
             model=used_model,
             max_tokens=max_tokens,
-            messages=[{"role": "user", "content": prompt}],
+            messages=[{"role": "user", "content": _user_content(prompt, cacheable_prefix)}],
+        )
+        return _finish_response(response, t0, cache_key)
+
+    except Exception as e:
+        elapsed = time.perf_counter() - t0
+        logger.error("LLM error after %.1fs: %s: %s", elapsed, type(e).__name__, e)
+        raise
+
+
+async def acall_llm(prompt: str, max_tokens: int = 2048, model: str = None, cache: bool = False,
+                    cacheable_prefix: str | None = None) -> str:
+    """Async variant of call_llm — awaits the request instead of blocking a thread."""
+    used_model = model or DEFAULT_MODEL
+    cache_key, cached = _cache_lookup(prompt, max_tokens, used_model, cache, cacheable_prefix)
+    if cached is not None:
+        return cached
+    _log_call(used_model, max_tokens, prompt, cacheable_prefix)
+
+    t0 = time.perf_counter()
+    try:
+        response = await async_client.chat.completions.create(
+            model=used_model,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": _user_content(prompt, cacheable_prefix)}],
+        )
+        return _finish_response(response, t0, cache_key)
+
+    except Exception as e:
+        elapsed = time.perf_counter() - t0
+        logger.error("LLM error after %.1fs: %s: %s", elapsed, type(e).__name__, e)
+        raise
+
+
+class _LeadingThinkFilter:
+    """Drops a leading <think>…</think> block from a stream of text deltas.
+
+    Deltas are held back only while the response could still be opening or inside
+    that block; everything after it passes straight through.
+    """
+
+    def __init__(self):
+        self._head = ""
+        self._passing = False
+
+    def feed(self, delta: str) -> str:
+        """Text to emit for this delta (may be empty while still buffering)."""
+        if self._passing:
+            return delta
+        self._head += delta
+        stripped = self._head.lstrip()
+        lowered = stripped.lower()
+        if "<think>".startswith(lowered):
+            return ""  # not enough text yet to tell
+        if lowered.startswith("<think>"):
+            end = lowered.find("</think>")
+            if end == -1:
+                return ""
+            stripped = stripped[end + len("</think>"):].lstrip()
+        self._passing = True
+        self._head = ""
+        return stripped
+
+    def finish(self) -> str:
+        """Whatever is still buffered when the stream ends (e.g. an unterminated think block)."""
+        if self._passing:
+            return ""
+        rest = _strip_think_tags(self._head)
+        return rest if rest and not rest.lower().startswith("<think>") else ""
+
+
+def _skip_leading_think(deltas: Iterator[str]) -> Iterator[str]:
+    """Pass text deltas through, dropping a leading <think>…</think> block."""
+    think_filter = _LeadingThinkFilter()
+    for delta in deltas:
+        text = think_filter.feed(delta)
+        if text:
+            yield text
+    rest = think_filter.finish()
+    if rest:
+        yield rest
+
+
+def call_llm_stream(prompt: str, max_tokens: int = 2048, model: str = None,
+                    cacheable_prefix: str | None = None) -> Iterator[str]:
+    """Like call_llm, but yields the response text in deltas as the model produces it."""
+    used_model = model or DEFAULT_MODEL
+    prompt_preview = (cacheable_prefix or prompt)[:120].replace("\n", " ")
+    logger.info("LLM stream → model=%s  max_tokens=%d  prompt='%s…'", used_model, max_tokens, prompt_preview)
+
+    t0 = time.perf_counter()
+    first_token_at = None
+    out_len = 0
+    try:
+        stream = client.chat.completions.create(
+            model=used_model,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": _user_content(prompt, cacheable_prefix)}],
+            stream=True,
+        )
+        raw_deltas = (
+            chunk.choices[0].delta.content
+            for chunk in stream
+            if chunk.choices and chunk.choices[0].delta.content
+        )
+        for delta in _skip_leading_think(raw_deltas):
+            if first_token_at is None:
+                first_token_at = time.perf_counter() - t0
+            out_len += len(delta)
+            yield delta
+
+        logger.info(
+            "LLM stream done ← %.1fs  first_token=%.1fs  clean_len=%d",
+            time.perf_counter() - t0, first_token_at or 0.0, out_len,
         )
-        raw = response.choices[0].message.content or ""
+
+    except Exception as e:
         elapsed = time.perf_counter() - t0
+        logger.error("LLM stream error after %.1fs: %s: %s", elapsed, type(e).__name__, e)
+        raise
 
-        # Token usage (if provided by OpenRouter)
-        usage = response.usage
-        tokens_info = ""
-        if usage:
-            tokens_info = f"  tokens(in={usage.prompt_tokens}, out={usage.completion_tokens})"
+
+async def acall_llm_stream(prompt: str, max_tokens: int = 2048, model: str = None,
+                           cacheable_prefix: str | None = None) -> AsyncIterator[str]:
+    """Async variant of call_llm_stream — yields text deltas without blocking the event loop."""
+    used_model = model or DEFAULT_MODEL
+    prompt_preview = (cacheable_prefix or prompt)[:120].replace("\n", " ")
+    logger.info("LLM stream → model=%s  max_tokens=%d  prompt='%s…'", used_model, max_tokens, prompt_preview)
+
+    t0 = time.perf_counter()
+    first_token_at = None
+    out_len = 0
+    think_filter = _LeadingThinkFilter()
+    try:
+        stream = await async_client.chat.completions.create(
+            model=used_model,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": _user_content(prompt, cacheable_prefix)}],
+            stream=True,
+        )
+        async for chunk in stream:
+            if not (chunk.choices and chunk.choices[0].delta.content):
+                continue
+            text = think_filter.feed(chunk.choices[0].delta.content)
+            if not text:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter() - t0
+            out_len += len(text)
+            yield text
+        rest = think_filter.finish()
+        if rest:
+            out_len += len(rest)
+            yield rest
 
         logger.info(
-            "LLM done ← %.1fs  raw_len=%d  clean_len=%d%s",
-            elapsed, len(raw), len(_strip_think_tags(raw)), tokens_info,
+            "LLM stream done ← %.1fs  first_token=%.1fs  clean_len=%d",
+            time.perf_counter() - t0, first_token_at or 0.0, out_len,
         )
-        logger.debug("LLM raw response (first 300 chars): %s", raw[:300])
 
-        return _strip_think_tags(raw)
+    except Exception as e:
+        elapsed = time.perf_counter() - t0
+        logger.error("LLM stream error after %.1fs: %s: %s", elapsed, type(e).__name__, e)
+        raise
+
+
+def call_llm_structured(prompt: str, name: str, schema: dict, max_tokens: int = 2048,
+                        model: str = None, cacheable_prefix: str | None = None) -> dict | None:
+    """Ask for a JSON object matching ``schema`` via a forced function call.
+
+    The model returns the object as tool-call arguments, so no text extraction is needed.
+    Returns None if the response carries no usable call (e.g. the model ignored tools).
+    """
+    used_model = model or DEFAULT_MODEL
+    logger.info("LLM structured call → model=%s  max_tokens=%d  tool=%s", used_model, max_tokens, name)
+
+    t0 = time.perf_counter()
+    try:
+        response = client.chat.completions.create(
+            model=used_model,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": _user_content(prompt, cacheable_prefix)}],
+            tools=[{"type": "function", "function": {"name": name, "parameters": schema}}],
+            tool_choice={"type": "function", "function": {"name": name}},
+        )
+        elapsed = time.perf_counter() - t0
+        tool_calls = response.choices[0].message.tool_calls or []
+        logger.info("LLM structured done ← %.1fs  tool_calls=%d", elapsed, len(tool_calls))
+        for call in tool_calls:
+            if call.function.name == name:
+                try:
+                    args = orjson.loads(call.function.arguments or "{}")
+                except orjson.JSONDecodeError:
+                    logger.warning("LLM structured: %s arguments were not valid JSON", name)
+                    return None
+                return args if isinstance(args, dict) else None
+        return None
 
     except Exception as e:
         elapsed = time.perf_counter() - t0
-        logger.error("LLM error after %.1fs: %s: %s", elapsed, type(e).__name__, e)
+        logger.error("LLM structured error after %.1fs: %s: %s", elapsed, type(e).__name__, e)
         raise
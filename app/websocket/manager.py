@@ -1,6 +1,6 @@
 from fastapi import WebSocket
 from typing import Dict, List
-import json
+import orjson
 import asyncio
 
 
@@ -12,6 +12,8 @@ class ConnectionManager:
         self.active_connections: Dict[str, List[WebSocket]] = {}
         # Map of user_id -> list of connected websockets (for general updates)
         self.user_connections: Dict[str, List[WebSocket]] = {}
+        # Map of task_id -> last message sent, so repeated identical updates are dropped
+        self.last_task_message: Dict[str, str] = {}
 
     async def connect(self, websocket: WebSocket, task_id: str = None, user_id: str = None):
         await websocket.accept()
@@ -31,6 +33,7 @@ class ConnectionManager:
             ]
             if not self.active_connections[task_id]:
                 del self.active_connections[task_id]
+                self.last_task_message.pop(task_id, None)
         if user_id and user_id in self.user_connections:
             self.user_connections[user_id] = [
                 ws for ws in self.user_connections[user_id] if ws != websocket
@@ -39,9 +42,16 @@ class ConnectionManager:
                 del self.user_connections[user_id]
 
     async def send_task_update(self, task_id: str, data: dict):
-        """Send update to all clients watching a specific task."""
+        """Send update to all clients watching a specific task.
+
+        An update identical to the previous one for the task (no step/status/data
+        change) is not re-sent.
+        """
         if task_id in self.active_connections:
-            message = json.dumps(data)
+            message = orjson.dumps(data).decode()
+            if self.last_task_message.get(task_id) == message:
+                return
+            self.last_task_message[task_id] = message
             dead_connections = []
             for ws in self.active_connections[task_id]:
                 try:
@@ -50,11 +60,14 @@ class ConnectionManager:
                     dead_connections.append(ws)
             for ws in dead_connections:
                 self.active_connections[task_id].remove(ws)
+            if not self.active_connections[task_id]:
+                del self.active_connections[task_id]
+                self.last_task_message.pop(task_id, None)
 
     async def send_user_update(self, user_id: str, data: dict):
         """Send update to all connections for a user."""
         if user_id in self.user_connections:
-            message = json.dumps(data)
+            message = orjson.dumps(data).decode()
             dead_connections = []
             for ws in self.user_connections[user_id]:
                 try:
@@ -66,7 +79,7 @@ class ConnectionManager:
 
     async def broadcast(self, data: dict):
         """Broadcast to all connected clients."""
-        message = json.dumps(data)
+        message = orjson.dumps(data).decode()
         for connections in self.user_connections.values():
             for ws in connections:
                 try:
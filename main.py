@@ -16,8 +16,9 @@ from pathlib import Path
 
 from app.config import settings
 from app.logging_config import setup_logging
-from app.database import engine, init_db
+from app.database import engine, init_db, pool_status
 from app.admin import setup_admin
+from app.services.llm import close_clients as close_llm_clients
 
 # Import routers
 from app.routers.auth import router as auth_router
@@ -55,6 +56,7 @@ async def lifespan(app: FastAPI):
 
     # ── Shutdown ──
     logger.info("Shutting down DealMind Backend...")
+    await close_llm_clients()
 
 
 app = FastAPI(
@@ -110,6 +112,7 @@ async def health_check():
     return {
         "status": "healthy",
         "database": "connected",
+        "database_pool": pool_status(),
         "agent": "quinn",
         "flows": ["qualification", "proposal", "monitoring"],
     }